@@ -0,0 +1,198 @@
+"""
+Benchmarks of the generator stages, over the real maze, and synthetic mazes of 1x, 4x and 16x it's area.
+
+Synthetic mazes are a lattice of corridors every `SPACING` pixels, with a random `REMOVED` fraction of corridors removed
+(then any dead ends pruned, so every position is a valid `TileType`), and the ghost jail cut out below the door at
+(41, 34), so the eye path BFS in `do_ghost_eye_movement_logic()` works as it does on the real maze.
+
+Each stage is timed (the best of `--repeat` runs), then ran once more under `tracemalloc` for it's peak memory. Outputs
+are written to a temporary directory, so /data/ is untouched. Results are written as JSON, which can be compared against
+a previous baseline with `--compare`.
+
+Usage:
+    python bench.py [--scales maze 1x 4x 16x] [--out benchmarks/baseline.json] [--compare benchmarks/baseline.json]
+
+Results are only written with `--out`, so comparing against a baseline never overwrites it. Timings depend on the machine,
+so baselines are recorded locally (`baseline.json` is ignored by git), i.e. with `--out benchmarks/baseline.json` before a
+change, then `--compare benchmarks/baseline.json` after it. Machine independent costs (conditions, sizes) are tracked by
+the build instead, see `--compare-costs` in main.py.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+import tracemalloc
+import numpy as np
+
+from typing import Callable
+
+from main import CONSTANTS, HEIGHT, WIDTH, Accounter, Color, ColorGrid, Term, Term3, TileType
+from main import do_entity_tile_type_logic, do_ghost_eye_movement_logic, eye_paths, load_grid, load_palette, load_texture, position_ranges
+
+
+def synthetic_texture(scale: int, seed: int = 0) -> ColorGrid:
+    """ A synthetic maze of `scale` x `scale` times the size of the real maze, see the module docstring """
+    width, height = WIDTH * scale, HEIGHT * scale
+    rng = np.random.default_rng(seed)
+    columns = range(ORIGIN[0] % SPACING, width, SPACING)
+    rows = range(ORIGIN[1] % SPACING, height, SPACING)
+    nodes = {(x, y) for x in columns for y in rows if not (JAIL[0] <= x <= JAIL[2] and JAIL[1] < y <= JAIL[3])}
+    edges = {
+        ((x, y), (x + dx, y + dy))
+        for x, y in nodes for dx, dy in ((SPACING, 0), (0, SPACING))
+        if (x + dx, y + dy) in nodes and rng.random() >= REMOVED
+    }
+
+    # Prune dead ends, until every node has at least two corridors
+    while True:
+        degree = {}
+        for a, b in edges:
+            degree[a] = degree.get(a, 0) + 1
+            degree[b] = degree.get(b, 0) + 1
+        dead = {node for node, d in degree.items() if d < 2}
+        if not dead:
+            break
+        edges = {(a, b) for a, b in edges if a not in dead and b not in dead}
+    assert degree.get(ORIGIN, 0) >= 2, 'Synthetic maze (scale=%d, seed=%d) does not include the ghost door' % (scale, seed)
+
+    array = np.full((width, height), ColorGrid.NONE, dtype=np.uint8)
+    for (x0, y0), (x1, y1) in edges:
+        array[x0:x1 + 1, y0:y1 + 1] = Color.GRAY
+    dots = np.zeros((width, height), dtype=bool)
+    dots[::3, ::3] = True
+    array[dots & (array == Color.GRAY)] = Color.WHITE
+    return ColorGrid(array)
+
+
+def run_stages(texture: ColorGrid, repeat: int) -> dict[str, dict]:
+    """ Runs each stage over `texture`, returning it's time and peak memory, or why it was skipped """
+    grid = load_grid(texture)
+    next_hop = eye_paths(texture)
+    table = {pos: TileType.to_player_type(tile) for pos, tile in grid.items()}
+    tiles = tuple(TileType.all_player_tiles())
+
+    def accounter() -> Accounter:
+        acc = Accounter('TileMap[X, Y]')
+        for tile in tiles:
+            acc.by_output[Term('T') == tile] = Term3([])
+        for tile in tiles:
+            positions = {pos for pos, value in table.items() if value == tile}
+            if positions:
+                acc.if_then(position_ranges(positions), Term('T') == tile)
+        return acc
+
+    stages: dict[str, Callable[[], object]] = {
+        'load_grid': lambda: load_grid(texture),
+        'position_ranges': lambda: [position_ranges({pos for pos, value in table.items() if value == tile}) for tile in tiles],
+        'accounter_build': None,  # Timed separately, as it excludes building the `Accounter`
+        'tile_type/decider': lambda: do_entity_tile_type_logic(grid, 'pacman/tile_type', tiles, TileType.to_player_type),
+        'tile_type/banked': lambda: do_entity_tile_type_logic(grid, 'pacman/tile_type', tiles, TileType.to_player_type, 'banked'),
+        'tile_type/packed': lambda: do_entity_tile_type_logic(grid, 'pacman/tile_type', tiles, TileType.to_player_type, 'packed'),
+        'eye_paths': lambda: eye_paths(texture),
+        'ghost_eyes/decider': lambda: do_ghost_eye_movement_logic(next_hop, 0),
+    }
+
+    results = {}
+    for name, stage in stages.items():
+        if name == 'tile_type/packed' and texture.width > len(CONSTANTS):
+            results[name] = {'skipped': 'Packed LUTs require width <= %d' % len(CONSTANTS)}
+            continue
+        if name == 'accounter_build':
+            acc = accounter()
+            stage = acc.build
+        results[name] = measure(stage, repeat)
+    return results
+
+
+def measure(stage: Callable[[], object], repeat: int) -> dict:
+    """ The best time of `repeat` runs of `stage`, and it's peak memory (excluding memory allocated before it) """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(seconds), 'peak_bytes': peak}
+
+
+def compare(baseline: dict, results: dict):
+    """ Prints the ratio of each stage's time and peak memory, against `baseline` """
+    for scale, stages in results['scales'].items():
+        for name, result in stages.items():
+            before = baseline.get('scales', {}).get(scale, {}).get(name)
+            if 'skipped' in result or before is None or 'skipped' in before:
+                continue
+            print('BENCH COMPARE %-4s %-20s time x%.2f, peak memory x%.2f' % (
+                scale, name, result['seconds'] / max(before['seconds'], 1e-9), result['peak_bytes'] / max(before['peak_bytes'], 1)
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the generator stages, over synthetic mazes of increasing size')
+    parser.add_argument('--scales', nargs='+', choices=tuple(SCALES), default=tuple(SCALES), help='Maze sizes to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs of each stage, of which the best is reported')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic mazes')
+    parser.add_argument('--out', type=str, default=None, help='Path to write the results to, i.e. benchmarks/baseline.json, otherwise they are only printed')
+    parser.add_argument('--compare', type=str, default=None, help='Baseline results to compare against')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        real = load_texture(load_palette(), 'assets/texture.png', WIDTH, HEIGHT + 5, 5)
+
+    results = {
+        'meta': {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(), 'seed': args.seed, 'repeat': args.repeat},
+        'scales': {},
+    }
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for scale in args.scales:
+                texture = real if SCALES[scale] is None else synthetic_texture(SCALES[scale], args.seed)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    stages = run_stages(texture, args.repeat)
+                results['scales'][scale] = stages
+                for name, result in stages.items():
+                    if 'skipped' in result:
+                        print('BENCH %-4s %-20s skipped: %s' % (scale, name, result['skipped']))
+                    else:
+                        print('BENCH %-4s %-20s %8.3fs, peak %7.1f MiB' % (scale, name, result['seconds'], result['peak_bytes'] / 2 ** 20))
+        finally:
+            os.chdir(cwd)
+
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), results)
+
+    if args.out is not None:
+        if os.path.dirname(args.out):
+            os.makedirs(os.path.dirname(args.out), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+        print('BENCH wrote %s' % args.out, file=sys.stderr)
+
+
+# Linear scale of each synthetic maze (so 4x area is 2x width and height), or `None` for the real maze
+SCALES = {'maze': None, '1x': 1, '4x': 2, '16x': 4}
+
+SPACING = 6  # Pixels between corridors of a synthetic maze
+REMOVED = 0.2  # Fraction of corridors removed from a synthetic maze
+ORIGIN = (41, 34)  # The ghost door, where the eye path BFS starts
+JAIL = (35, 34, 47, 46)  # (x0, y0, x1, y1) of the ghost jail, below the door, which has no corridors in a synthetic maze
+
+
+if __name__ == '__main__':
+    main()
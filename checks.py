@@ -0,0 +1,206 @@
+"""
+Checks of the LUTs in /data/ against Python reference models, over their entire input domain.
+
+Each LUT is evaluated with `Circuit.fires()`, which gives, for a batch of inputs, which deciders (cases of the LUT) fire.
+This is compared against the reference, and every input is classified as either:
+- A mismatch, where a single case fires, but it produces a different value to the reference
+- Overlapping, where more than one case fires, so the outputs would be summed
+- Uncovered, where no case fires, but the reference requires a value
+
+Inputs where the reference does not specify a value (i.e. -1 | D1 | ?? when D1 cannot move) are don't-cares.
+"""
+
+import numpy as np
+
+from typing import NamedTuple
+
+from main import BACKGROUND_PIXELS, CONSTANTS, HEIGHT, QUALITY, WIDTH, Direction, TileType, decode_blueprint_string, eye_path_lookup, eye_paths, load_palette, load_texture
+from simulator import Circuit, signal_key
+
+
+class Report(NamedTuple):
+    name: str
+    inputs: int
+    mismatches: int
+    overlapping: int
+    uncovered: int
+
+    def ok(self) -> bool:
+        return self.mismatches == self.overlapping == self.uncovered == 0
+
+    def __str__(self):
+        return 'CHECK %s: %d inputs, %d mismatches, %d overlapping, %d uncovered' % self
+
+
+def check_all() -> list[Report]:
+    """ Runs every check, printing a report for each, and raises if any fail """
+    reports = check_pacman_movement() + [check_shared_path_lookup()] + check_packed_backgrounds()
+    for report in reports:
+        print(report)
+    failed = [report.name for report in reports if not report.ok()]
+    if failed:
+        raise ValueError('Checks failed: %s' % ', '.join(failed))
+    return reports
+
+
+def check_pacman_movement() -> list[Report]:
+    """
+    Checks the pacman movement LUTs, against the truth table in the docstring of `do_pacman_movement_logic()`.
+    The domain is every D1, D2, D3 in [-1, 3], every player tile type, and every value of the M1, M2, M3 flags.
+    """
+    tiles = np.array(list(TileType.all_player_tiles()))
+    directions = np.array(Direction.all_or_none())
+    d1, d2, d3, m1, m2, m3, tile = (
+        a.ravel() for a in np.meshgrid(directions, directions, directions, (0, 1), (0, 1), (0, 1), tiles, indexing='ij')
+    )
+    inputs = {'D1': d1, 'D2': d2, 'D3': d3, 'M1': m1, 'M2': m2, 'M3': m3, 'T': tile}
+
+    d2_next, d3_next, d_move = reference_pacman_movement(d1, d2, d3, m1, m2, m3)
+    reports = [
+        check_values('pacman/d2_next', inputs, 'D2', d2_next),
+        check_values('pacman/d3_next', inputs, 'D3', d3_next),
+        check_values('pacman/d_move', inputs, 'D', d_move),
+    ]
+    for n, dn in enumerate((d1, d2, d3)):
+        expected = np.array([reference_can_move(TileType(t), Direction(d)) if d != -1 else -2 for t, d in zip(tile, dn)])
+        reports.append(check_values('pacman/d%d_can_move' % (n + 1), inputs, 'M%d' % (n + 1), expected))
+    return reports
+
+
+def check_shared_path_lookup() -> Report:
+    """
+    Checks the shared eye path lookup, over every (X, Y, I), against the path lookup table of each ghost I. Positions which
+    are not on any ghost's path are don't-cares.
+    """
+    next_hop = eye_paths(load_texture(load_palette(), 'assets/texture.png', WIDTH, HEIGHT + 5, 5))
+    x, y, index = (a.ravel() for a in np.meshgrid(np.arange(WIDTH), np.arange(HEIGHT), np.arange(4), indexing='ij'))
+    expected = np.full(x.shape, -2)
+    for ghost in range(4):
+        for (px, py), value in eye_path_lookup(next_hop, ghost).items():
+            expected[(px * HEIGHT + py) * 4 + ghost] = value
+    return check_values('ghost/shared/path_lookup', {'X': x, 'Y': y, 'I': index}, 'M', expected)
+
+
+def check_packed_backgrounds() -> list[Report]:
+    """
+    Checks each packed background, unpacked (and added to it's base, for deltas), against the unpacked background, over
+    every pixel. Pixels whose signal is set by more than one filter of the same blueprint are overlapping, and non-empty
+    pixels whose signal isn't set by any filter (of the background or it's base) are uncovered.
+    """
+    reports = []
+    for name, base in (('game', None), ('victory', 'game'), ('title', None)):
+        packed, filters = background_array('background/packed/' + name)
+        overlapping, covered = filters > 1, filters > 0
+        if base is not None:
+            base_packed, base_filters = background_array('background/packed/' + base)
+            packed += base_packed
+            overlapping |= base_filters > 1
+            covered |= base_filters > 0
+        pixels = (packed[:, None, :] >> (4 * np.arange(BACKGROUND_PIXELS))[None, :, None]) & 0xF
+        actual = pixels.reshape(-1, HEIGHT)[:WIDTH]
+        expected = background_array('background/' + name)[0][:WIDTH]
+        overlapping, covered = (np.repeat(cells, BACKGROUND_PIXELS, axis=0)[:WIDTH] for cells in (overlapping, covered))
+        reports.append(Report(
+            'background/packed/' + name,
+            expected.size,
+            int((actual != expected).sum()),
+            int(overlapping.sum()),
+            int(((expected != 0) & ~covered).sum()),
+        ))
+    return reports
+
+
+def background_array(name: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The [signal, y] counts of the background at /data/<name>.txt (see `do_background()`), and the number of filters
+    setting each
+    """
+    with open('data/%s.txt' % name, 'r', encoding='utf-8') as f:
+        bp = decode_blueprint_string(f.read())
+    rows = sorted((e for e in bp['blueprint']['entities'] if e['name'] == 'constant-combinator'), key=lambda e: e['position']['y'])
+    array = np.zeros((len(CONSTANTS), HEIGHT), dtype=np.int64)
+    filters = np.zeros((len(CONSTANTS), HEIGHT), dtype=np.int64)
+    for band, row in enumerate(rows):
+        for f in row['control_behavior']['sections']['sections'][0].get('filters', ()):
+            cell = CONSTANTS.index(f['name']), band * 5 + QUALITY.index(f['quality'])
+            array[cell] += f['count']
+            filters[cell] += 1
+    return array, filters
+
+
+def check_values(name: str, inputs: dict[str, np.ndarray], output: str, expected: np.ndarray) -> Report:
+    """
+    Checks the LUT at /data/<name>.txt against `expected`, where -2 is a don't-care, by simulating it and reading the
+    `output` signal. Inputs where more than one decider emitting `output` fires are also reported as overlapping, as
+    their outputs are summed, and inputs where none fire, but `expected` is non-zero, as uncovered.
+    """
+    with open('data/%s.txt' % name, 'r', encoding='utf-8') as f:
+        bp = decode_blueprint_string(f.read())
+    circuit = Circuit(bp, inputs)
+    actual = circuit.settle(red=inputs)[output]
+
+    key = signal_key(output)
+    fires = circuit.fires(red=inputs)
+    count = sum((
+        fires[entity['entity_number']].astype(np.int32)
+        for entity in circuit.entities
+        if entity['name'] == 'decider-combinator'
+        and any(signal_key(out['signal']) == key for out in entity['control_behavior']['decider_conditions'].get('outputs', ()) if 'signal' in out)
+    ), np.zeros(expected.shape, dtype=np.int32))
+    cared = expected != -2
+    return Report(
+        name,
+        int(cared.sum()),
+        int((cared & (actual != expected)).sum()),
+        int((count > 1).sum()),
+        int((cared & (count == 0) & (expected != 0)).sum()),
+    )
+
+
+def reference_pacman_movement(d1, d2, d3, m1, m2, m3) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The truth table in the docstring of `do_pacman_movement_logic()`, over arrays of inputs.
+    Returns the next (D2, D3, D_MOVE), where -2 is unspecified.
+    """
+    none = np.full(d1.shape, -1)
+    unspecified = np.full(d1.shape, -2)
+    cases = [
+        # -1 | -1 | ?? | d2 <= -1, d3 <= -1, move <= -1
+        ((d1 == -1) & (d2 == -1), (none, none, none)),
+        # D1 | -1 | ?? | if can_move(D1)
+        ((d1 != -1) & (d2 == -1) & (m1 == 1), (d1, none, d1)),
+        ((d1 != -1) & (d2 == -1) & (m1 == 0), (unspecified, unspecified, unspecified)),
+        # -1 | D2 | -1 | if can_move(D2), else
+        ((d1 == -1) & (d2 != -1) & (d3 == -1) & (m2 == 1), (d2, none, d2)),
+        ((d1 == -1) & (d2 != -1) & (d3 == -1) & (m2 == 0), (d2, none, none)),
+        # D1 | D2 | ?? | if can_move(D1), elif can_move(D2), else
+        ((d1 != -1) & (d2 != -1) & (m1 == 1), (d1, none, d1)),
+        ((d1 != -1) & (d2 != -1) & (m1 == 0) & (m2 == 1), (d2, d1, d2)),
+        ((d1 != -1) & (d2 != -1) & (m1 == 0) & (m2 == 0), (d2, d1, none)),
+        # -1 | D2 | D3 | if can_move(D3), elif can_move(D2), else
+        ((d1 == -1) & (d2 != -1) & (d3 != -1) & (m3 == 1), (d3, none, d3)),
+        ((d1 == -1) & (d2 != -1) & (d3 != -1) & (m3 == 0) & (m2 == 1), (d2, d3, d2)),
+        ((d1 == -1) & (d2 != -1) & (d3 != -1) & (m3 == 0) & (m2 == 0), (d2, d3, none)),
+    ]
+    return tuple(np.select([mask for mask, _ in cases], [outputs[i] for _, outputs in cases], -2) for i in range(3))
+
+
+def reference_can_move(tile: TileType, direction: Direction) -> int:
+    """ 1 if pacman can move in `direction` from `tile`, by the directions each tile type is named for """
+    match tile:
+        case TileType.STRAIGHT_H | TileType.EDGE_LEFT | TileType.EDGE_RIGHT:
+            return int(direction in (Direction.LEFT, Direction.RIGHT))
+        case TileType.STRAIGHT_V:
+            return int(direction in (Direction.UP, Direction.DOWN))
+        case TileType.FOUR_WAY:
+            return 1
+    first, second = tile.name.split('_', 1)
+    if first == 'CURVE':
+        return int(direction.name in second.split('_'))
+    if first == 'T':
+        return int(direction.name != second)
+    raise ValueError('Unknown tile type %s' % tile)
+
+
+if __name__ == '__main__':
+    check_all()
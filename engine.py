@@ -0,0 +1,391 @@
+"""
+Reference game engine, which steps many independent games in parallel, as NumPy arrays over the batch of games.
+
+The engine uses the same data as the generated blueprints: `load_grid()` for tile types, `dots_mask()` for dots, and the
+LUTs in /data/ (evaluated once over their entire domain with `Circuit`) for pacman movement, can_move, ghost turns,
+frightened movement, and the eye path lookups. So the build must have been run first.
+
+One step of the engine is one game logic tick (24 ticks of the clock). Rules which are not encoded in any LUT follow the
+original game, scaled to the 3px grid:
+- PacMan eats a dot (10) or energizer (50), and energizers frighten all active ghosts for `FRIGHTENED_TICKS`
+- Ghost targets are per-ghost as in the original, with alternating scatter (G = 1) and chase (G = 0) phases
+- Ghosts move at half speed when frightened, or on GHOST_SLOW tiles, and eyes move at double speed
+- Ghosts start in jail and are released one at a time. Eaten ghosts return to jail as eyes, and are released again
+- Touching a ghost either eats it (200, 400, 800, 1600 within one energizer) or loses a life, resetting positions
+
+Usage: `python engine.py --games 1000 --ticks 2000`
+"""
+
+import time
+import argparse
+import numpy as np
+
+from typing import NamedTuple
+
+from main import HEIGHT, WIDTH, Color, Direction, TileType, decode_blueprint_string, dots_mask, load_grid, load_palette, load_texture
+from simulator import Circuit
+
+
+class Tables(NamedTuple):
+    tile: np.ndarray            # [x, y] -> TileType, or -1 if not a path
+    player_tile: np.ndarray     # [x, y] -> TileType, as seen by pacman, see `TileType.to_player_type()`
+    can_move: np.ndarray        # [tile, d + 1] -> 0 | 1
+    pacman: np.ndarray          # [d1 + 1, d2 + 1, d3 + 1, m1, m2, m3] -> (d2, d3, move)
+    turn: np.ndarray            # [tile, d, h, v, s1, s2] -> -1 (left) | 0 (straight) | 1 (right)
+    random: np.ndarray          # [tile, d, r3, r4] -> outgoing direction
+    path: np.ndarray            # [ghost, x, y] -> M
+    step: np.ndarray            # [x, y, d] -> next (x, y), where edges wrap around, or (x, y) if not a path
+    dots: np.ndarray            # [x, y] -> 1 if a dot
+    energizers: np.ndarray      # [x, y] -> 1 if an energizer
+
+
+class State(NamedTuple):
+    tick: np.ndarray            # [game]
+    done: np.ndarray            # [game] 0 = Playing, 1 = Won, 2 = Game Over, or 3 = Out of ticks
+    score: np.ndarray           # [game]
+    lives: np.ndarray           # [game]
+    dots: np.ndarray            # [game, x, y] dots and energizers remaining
+    pacman: np.ndarray          # [game, (x, y, d1, d2, d3)]
+    ghosts: np.ndarray          # [game, ghost, (x, y, d)]
+    mode: np.ndarray            # [game, ghost] see `Mode`
+    timer: np.ndarray           # [game, ghost] frightened ticks (V1-4), or ticks until release when in jail
+    eaten: np.ndarray           # [game] ghosts eaten during the current energizer
+    latch: np.ndarray           # [game, ghost] flips each tick, for half speed movement
+    deaths: np.ndarray          # [game, ghost] number of times each ghost has caught pacman
+
+
+class Mode:
+    ACTIVE = 0
+    JAIL = 1
+    EYES = 2
+
+
+def load_tables() -> Tables:
+    """ Loads the grid from the texture, and evaluates each LUT in /data/ over it's entire domain """
+    texture = load_texture(load_palette(), 'assets/texture.png', WIDTH, HEIGHT + 5, 5)
+    grid_to_tile_type = load_grid(texture)
+
+    tile = np.full((WIDTH, HEIGHT), -1, dtype=np.int64)
+    player_tile = np.full((WIDTH, HEIGHT), -1, dtype=np.int64)
+    for pos, tile_type in grid_to_tile_type.items():
+        tile[pos] = tile_type
+        player_tile[pos] = TileType.to_player_type(tile_type)
+
+    # Step table, with wrap around between the left and right edges
+    step = np.zeros((WIDTH, HEIGHT, 4, 2), dtype=np.int64)
+    xs, ys = np.meshgrid(np.arange(WIDTH), np.arange(HEIGHT), indexing='ij')
+    for d in Direction:
+        dx, dy = DELTAS[d]
+        nx, ny = (xs + dx) % WIDTH, (ys + dy) % HEIGHT
+        step[:, :, d, 0] = np.where(tile[nx, ny] >= 0, nx, xs)
+        step[:, :, d, 1] = np.where(tile[nx, ny] >= 0, ny, ys)
+    edges = {TileType(t): tuple(map(int, p)) for t in (TileType.EDGE_LEFT, TileType.EDGE_RIGHT) for p in np.argwhere(tile == t)}
+    step[edges[TileType.EDGE_LEFT] + (Direction.LEFT,)] = edges[TileType.EDGE_RIGHT]
+    step[edges[TileType.EDGE_RIGHT] + (Direction.RIGHT,)] = edges[TileType.EDGE_LEFT]
+
+    tiles, directions = np.arange(len(TileType)), np.arange(-1, 4)
+
+    # can_move[T, D]
+    t, d = grid(tiles, directions)
+    can_move = lut_values('pacman/d1_can_move', {'T': t, 'D1': d}, 'M1').reshape(len(TileType), 5)
+
+    # Pacman movement[D1, D2, D3, M1, M2, M3] -> (d2, d3, move)
+    d1, d2, d3, m1, m2, m3 = grid(directions, directions, directions, (0, 1), (0, 1), (0, 1))
+    inputs = {'D1': d1, 'D2': d2, 'D3': d3, 'M1': m1, 'M2': m2, 'M3': m3}
+    pacman = np.stack([
+        lut_values('pacman/%s' % name, inputs, output)
+        for name, output in (('d2_next', 'D2'), ('d3_next', 'D3'), ('d_move', 'D'))
+    ], axis=-1).reshape(5, 5, 5, 2, 2, 2, 3)
+
+    # turn[T, D, H, V, S1, S2]
+    t, d, h, v, s1, s2 = grid(tiles, np.arange(4), (0, 1), (0, 1), (0, 1), (0, 1))
+    turns = {'Output straight': 0, 'Output left turn': -1, 'Output right turn': 1}
+    turn = lut_cases('ghost/turn', {'T': t, 'D': d, 'H': h, 'V': v, 'S1': s1, 'S2': s2}, turns.get).reshape(len(TileType), 4, 2, 2, 2, 2)
+
+    # random[T, D, R3, R4]
+    t, d, r3, r4 = grid(tiles, np.arange(4), np.arange(3), np.arange(4))
+    random = lut_values('ghost/random', {'T': t, 'D': d, 'R3': r3, 'R4': r4}, 'D').reshape(len(TileType), 4, 3, 4)
+
+    # path[ghost, X, Y]
+    path = np.stack([
+        lut_values('ghost/path_lookup_%d' % ghost, {'X': xs.ravel(), 'Y': ys.ravel()}, 'M').reshape(WIDTH, HEIGHT)
+        for ghost in range(4)
+    ])
+
+    return Tables(tile, player_tile, can_move, pacman, turn, random, path, step, dots_mask(texture), texture.mask(Color.RED))
+
+
+def grid(*axes) -> list[np.ndarray]:
+    """ Every combination of values from `axes`, as flattened arrays """
+    return [a.ravel() for a in np.meshgrid(*axes, indexing='ij')]
+
+
+def load_lut(name: str, inputs: dict[str, np.ndarray]) -> tuple[dict, Circuit]:
+    with open('data/%s.txt' % name, 'r', encoding='utf-8') as f:
+        bp = decode_blueprint_string(f.read())
+    return bp, Circuit(bp, inputs)
+
+
+def lut_cases(name: str, inputs: dict[str, np.ndarray], case, default: int = 0) -> np.ndarray:
+    """ Evaluates a LUT where each decider is a case, with a value given by `case(description)`. """
+    bp, circuit = load_lut(name, inputs)
+    fires = circuit.fires(red=inputs)
+    result = np.full(next(iter(inputs.values())).shape, default)
+    for entity in circuit.entities:
+        result = np.where(fires[entity['entity_number']], case(entity.get('player_description', '')), result)
+    return result
+
+
+def lut_values(name: str, inputs: dict[str, np.ndarray], output: str) -> np.ndarray:
+    """ Evaluates a LUT by simulating it, and reading the `output` signal """
+    bp, circuit = load_lut(name, inputs)
+    return circuit.settle(red=inputs)[output].astype(np.int64)
+
+
+class Engine:
+    """ Steps a batch of independent games, see the module docstring """
+    def __init__(self, tables: Tables, games: int, seed: int = 0, turn_chance: float = 0.1, seeds: np.ndarray | None = None):
+        self.tables = tables
+        self.games = games
+        self.rng = np.random.default_rng(seed)
+        self.seeds = (seed + np.arange(games) if seeds is None else np.asarray(seeds)).astype(np.uint64)
+        self.turn_chance = turn_chance
+        self.index = np.arange(games)
+
+        self.state = State(
+            tick=np.zeros(games, dtype=np.int64),
+            done=np.zeros(games, dtype=np.int64),
+            score=np.zeros(games, dtype=np.int64),
+            lives=np.full(games, LIVES, dtype=np.int64),
+            dots=np.broadcast_to(tables.dots | tables.energizers, (games, WIDTH, HEIGHT)).copy(),
+            pacman=np.zeros((games, 5), dtype=np.int64),
+            ghosts=np.zeros((games, 4, 3), dtype=np.int64),
+            mode=np.zeros((games, 4), dtype=np.int64),
+            timer=np.zeros((games, 4), dtype=np.int64),
+            eaten=np.zeros(games, dtype=np.int64),
+            latch=np.zeros((games, 4), dtype=np.int64),
+            deaths=np.zeros((games, 4), dtype=np.int64),
+        )
+        self.reset_positions(np.ones(games, dtype=bool))
+
+    def reset_positions(self, mask: np.ndarray):
+        """ Resets pacman and the ghosts to their start positions, for games in `mask` """
+        s = self.state
+        s.pacman[mask] = (*PACMAN_START, -1, -1, -1)
+        s.ghosts[mask] = [(*GHOST_JAIL[g], Direction.LEFT) for g in range(4)]
+        s.mode[mask] = Mode.JAIL
+        s.timer[mask] = np.arange(4) * RELEASE_TICKS
+        s.eaten[mask] = 0
+
+    def run(self, ticks: int) -> State:
+        """ Steps until every game is done, or `ticks` have passed """
+        for _ in range(ticks):
+            if self.state.done.all():
+                break
+            self.step()
+        self.state.done[self.state.done == 0] = 3
+        return self.state
+
+    def step(self, d1: np.ndarray | None = None):
+        """ Steps every game by one tick, with D1 from `d1` if given, or otherwise from a random controller """
+        s, t = self.state, self.tables
+        playing = s.done == 0
+        s.tick[playing] += 1
+
+        # PacMan: D1 from the controller, then the movement LUTs choose the next D2, D3 and the move
+        x, y, _, d2, d3 = s.pacman.T
+        if d1 is None:
+            change = self.rng.random(self.games) < self.turn_chance
+            d1 = np.where(change, self.rng.integers(-1, 4, self.games), s.pacman[:, 2])
+        tile = t.player_tile[x, y]
+        m1, m2, m3 = (t.can_move[tile, d + 1] * (d != -1) for d in (d1, d2, d3))
+        d2_next, d3_next, move = t.pacman[d1 + 1, d2 + 1, d3 + 1, m1, m2, m3].T
+        nx, ny = t.step[x, y, move.clip(0)].T * (move != -1) + np.stack([x, y]) * (move == -1)
+        previous = s.pacman[:, :2].copy()
+        s.pacman[playing] = np.stack([nx, ny, d1, d2_next, d3_next], axis=-1)[playing]
+        x, y = s.pacman[:, 0], s.pacman[:, 1]
+
+        # Dots and energizers
+        dot = s.dots[self.index, x, y] & playing
+        energizer = dot & t.energizers[x, y]
+        s.dots[self.index, x, y] &= ~dot
+        s.score[:] += np.where(energizer, 50, np.where(dot, 10, 0))
+        frighten = energizer[:, None] & (s.mode == Mode.ACTIVE)
+        s.timer[frighten] = FRIGHTENED_TICKS
+        s.eaten[energizer] = 0
+
+        ghost_previous = s.ghosts[:, :, :2].copy()
+        self.step_ghosts(playing)
+        self.collide(playing, previous, ghost_previous)
+
+        s.done[playing & ~s.dots.any(axis=(1, 2))] = 1
+        s.done[playing & (s.lives == 0)] = 2
+
+    def step_ghosts(self, playing: np.ndarray):
+        s, t = self.state, self.tables
+        gx, gy, gd = s.ghosts[..., 0], s.ghosts[..., 1], s.ghosts[..., 2]
+        active = playing[:, None] & (s.mode == Mode.ACTIVE)
+        frightened = active & (s.timer > 0)
+        s.latch[:] ^= 1
+
+        # Jail: count down, then release at the door
+        jail = playing[:, None] & (s.mode == Mode.JAIL)
+        s.timer[jail] -= 1
+        release = jail & (s.timer <= 0)
+        s.ghosts[release] = (*GHOST_DOOR, Direction.LEFT)
+        s.mode[release] = Mode.ACTIVE
+        s.timer[release] = 0
+
+        # Eyes: two steps per tick along the path lookup, until reaching the end in jail
+        eyes = playing[:, None] & (s.mode == Mode.EYES)
+        for step in range(2):
+            m = t.path[np.arange(4), gx, gy]
+            dx = np.where(m == 12, FINAL_STEP[:, 0] * (step == 0), PATH_STEPS[m.clip(0, 11), step, 0])
+            dy = np.where(m == 12, FINAL_STEP[:, 1] * (step == 0), PATH_STEPS[m.clip(0, 11), step, 1])
+            moving = eyes & (s.mode == Mode.EYES)
+            gx[moving] += dx[moving]
+            gy[moving] += dy[moving]
+            arrived = moving & (gx == GHOST_JAIL[:, 0]) & (gy == GHOST_JAIL[:, 1])
+            s.mode[arrived] = Mode.JAIL
+            s.timer[arrived] = RESPAWN_TICKS
+
+        # Active: choose a direction, either from the turn LUT towards the target, or from the random LUT when frightened
+        tile = t.tile[gx, gy].clip(0)
+        slow = (frightened | (tile == TileType.STRAIGHT_H_GHOST_SLOW)) & (s.latch == 1)
+        moving = active & ~slow
+        tx, ty = self.targets()
+        h = (tx >= gx).astype(np.int64)
+        v = (ty < gy).astype(np.int64)
+        s1 = ((ty - gy) > (tx - gx)).astype(np.int64)
+        s2 = ((ty - gy) > (gx - tx)).astype(np.int64)
+        chase = (gd + t.turn[tile, gd, h, v, s1, s2]) % 4
+        noise = mix(self.seeds[:, None], s.tick[:, None].astype(np.uint64), np.arange(4, dtype=np.uint64))
+        r3, r4 = (noise % np.uint64(3)).astype(np.int64), ((noise >> np.uint64(8)) % np.uint64(4)).astype(np.int64)
+        scared = t.random[tile, gd, r3, r4]
+        d = np.where(frightened, scared, chase)
+        nx, ny = t.step[gx, gy, d, 0], t.step[gx, gy, d, 1]
+        gx[moving], gy[moving], gd[moving] = nx[moving], ny[moving], d[moving]
+        s.timer[frightened] -= 1
+
+    def targets(self) -> tuple[np.ndarray, np.ndarray]:
+        """ The (X, Y) target of each ghost, as in the original game. Scatter targets are corners, and chase targets are by ghost """
+        s = self.state
+        px, py, d2 = s.pacman[:, 0], s.pacman[:, 1], s.pacman[:, 3]
+        ahead = np.where(d2[:, None] >= 0, DELTAS[d2.clip(0)], 0)
+        blinky = s.ghosts[:, 0, :2]
+
+        tx = np.stack([
+            px,
+            px + 4 * TILE * ahead[:, 0],
+            2 * (px + 2 * TILE * ahead[:, 0]) - blinky[:, 0],
+            px,
+        ], axis=1)
+        ty = np.stack([
+            py,
+            py + 4 * TILE * ahead[:, 1],
+            2 * (py + 2 * TILE * ahead[:, 1]) - blinky[:, 1],
+            py,
+        ], axis=1)
+
+        # Clyde scatters when close to pacman
+        near = (s.ghosts[:, 3, 0] - px) ** 2 + (s.ghosts[:, 3, 1] - py) ** 2 < (8 * TILE) ** 2
+        scatter = ((s.tick % (SCATTER_TICKS + CHASE_TICKS)) < SCATTER_TICKS)[:, None] | (np.arange(4) == 3) & near[:, None]
+        tx = np.where(scatter, SCATTER_TARGETS[:, 0], tx)
+        ty = np.where(scatter, SCATTER_TARGETS[:, 1], ty)
+        return tx, ty
+
+    def collide(self, playing: np.ndarray, previous: np.ndarray, ghost_previous: np.ndarray):
+        """ Handles pacman touching a ghost, either on the same position, or passing through each other """
+        s = self.state
+        pacman = s.pacman[:, None, :2]
+        touch = (pacman == s.ghosts[:, :, :2]).all(axis=2) | (
+            (pacman == ghost_previous).all(axis=2) & (previous[:, None] == s.ghosts[:, :, :2]).all(axis=2)
+        )
+        touch &= playing[:, None] & (s.mode == Mode.ACTIVE)
+
+        # Eat frightened ghosts, in order
+        eat = touch & (s.timer > 0)
+        for g in range(4):
+            s.score[:] += np.where(eat[:, g], 200 << s.eaten.clip(0, 3), 0)
+            s.eaten[:] += eat[:, g]
+        s.mode[eat] = Mode.EYES
+        s.timer[eat] = 0
+
+        # Otherwise, lose a life
+        caught = touch & ~eat
+        s.deaths[:] += caught
+        lost = caught.any(axis=1)
+        s.lives[:] -= lost
+        self.reset_positions(lost)
+
+
+def mix(*values: np.ndarray) -> np.ndarray:
+    """
+    Hashes `values` (broadcast together) to uint64, with the splitmix64 finalizer. Frightened ghost randomness is a hash of
+    the (seed, tick, ghost) of each game, so a game's behavior doesn't depend on the other games in the batch, or on
+    the history of the random state, and a game can be resumed from a snapshot of it's `State`.
+    """
+    h = np.uint64(0)
+    with np.errstate(over='ignore'):
+        for value in values:
+            h = (h ^ value) + np.uint64(0x9E3779B97F4A7C15)
+            h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            h = h ^ (h >> np.uint64(31))
+    return h
+
+
+def report(state: State, seconds: float, steps: int):
+    games = state.done.shape[0]
+    print('ENGINE %d games, %d steps in %.2fs, %.0f game ticks per second' % (games, steps, seconds, games * steps / seconds))
+    for value, name in ((1, 'won'), (2, 'game over'), (3, 'out of ticks')):
+        print('ENGINE %s: %d' % (name, (state.done == value).sum()))
+    ticks = state.tick
+    print('ENGINE game length: mean %.1f, p10 %d, p50 %d, p90 %d' % (ticks.mean(), *np.percentile(ticks, (10, 50, 90))))
+    print('ENGINE score: mean %.1f, max %d' % (state.score.mean(), state.score.max()))
+    print('ENGINE deaths by ghost: %s' % state.deaths.sum(axis=0).tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a batch of games with the reference engine, and reports statistics')
+    parser.add_argument('--games', type=int, default=1000, help='Number of games to run in parallel')
+    parser.add_argument('--ticks', type=int, default=2000, help='Maximum number of game ticks to run each game for')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the controller and frightened ghost randomness')
+    args = parser.parse_args()
+
+    engine = Engine(load_tables(), args.games, args.seed)
+    start = time.perf_counter()
+    state = engine.run(args.ticks)
+    report(state, time.perf_counter() - start, int(state.tick.max()))
+
+
+# (dX, dY) of each direction
+DELTAS = np.array([(0, -1), (1, 0), (0, 1), (-1, 0)])
+
+# (dX, dY), (dX2, dY2) for each M in [0, 11], see `do_ghost_eye_movement_logic()`
+PATH_STEPS = np.array([
+    [(0, 1), (0, 1)], [(0, 1), (-1, 0)], [(0, 1), (1, 0)],
+    [(0, -1), (0, -1)], [(0, -1), (-1, 0)], [(0, -1), (1, 0)],
+    [(1, 0), (1, 0)], [(1, 0), (0, -1)], [(1, 0), (0, 1)],
+    [(-1, 0), (-1, 0)], [(-1, 0), (0, -1)], [(-1, 0), (0, 1)],
+])
+
+# (dX, dY) for M = 12, per ghost
+FINAL_STEP = np.array([(0, 1), (0, 1), (-1, 0), (1, 0)])
+
+PACMAN_START = (41, 70)
+GHOST_DOOR = (41, 34)
+GHOST_JAIL = np.array([(41, 41), (41, 44), (36, 44), (46, 44)])
+SCATTER_TARGETS = np.array([(WIDTH, -3), (0, -3), (WIDTH, HEIGHT), (0, HEIGHT)])
+
+TILE = 3  # Pixels per tile of the original game
+LIVES = 3
+RELEASE_TICKS = 40
+RESPAWN_TICKS = 10
+FRIGHTENED_TICKS = 75  # 6s at 12.5 TPS
+SCATTER_TICKS = 88  # 7s
+CHASE_TICKS = 250  # 20s
+
+
+if __name__ == '__main__':
+    main()
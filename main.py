@@ -1,11 +1,22 @@
 import os
+import ast
+import math
+import time
 import zlib
 import json
 import base64
+import fnmatch
+import hashlib
+import inspect
+import argparse
+
+import numpy as np
 
 from PIL import Image
-from typing import NamedTuple
-from collections import defaultdict
+from typing import Any, Callable, NamedTuple
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
 from enum import IntEnum
 
 Point = tuple[int, int]
@@ -25,9 +36,9 @@ class Color(IntEnum):
     GRAY = 9
 
     @staticmethod
-    def is_any_path_color(px: 'Color') -> bool:
-        """ Returns `true` if `px` is found on any path tile. """
-        return px == Color.GRAY or px == Color.WHITE or px == Color.YELLOW or px == Color.RED or px == Color.CYAN
+    def path_colors() -> tuple['Color', ...]:
+        """ All colors which are found on path tiles. """
+        return Color.GRAY, Color.WHITE, Color.YELLOW, Color.RED, Color.CYAN
 
 
 class Direction(IntEnum):
@@ -39,6 +50,11 @@ class Direction(IntEnum):
     DOWN = 2
     LEFT = 3
 
+    @staticmethod
+    def all_or_none() -> tuple[int, ...]:
+        """ All directions, plus -1, for signals that may have no direction """
+        return (-1, *Direction)
+
 class TileType(IntEnum):
     # Straight H/V are named for the directions that ARE included
     STRAIGHT_H = 0
@@ -78,59 +94,250 @@ class TileType(IntEnum):
 
 
 def main():
-    get_color, get_bg_color, get_text_color = load_textures()
-    grid_to_tile_type: dict[Point, TileType] = load_grid(get_color)
-
-    do_background('background/game', lambda x, y: c if (c := get_color(x, y)) == Color.BLUE or c == Color.PINK else None)
-    do_background('background/victory', lambda x, y: Color.WHITE if (c := get_color(x, y)) == Color.BLUE or c == Color.PINK else None)
-    do_background('background/title', lambda x, y: c if (c := get_bg_color(x, y)) != Color.BLACK else None)
-    do_text('text/ready', get_text_color, 0)
-    do_text('text/game_over', get_text_color, 5)
-    do_dots_logic('_values', get_color, lambda v, _: v)
-    do_dots_logic('_sequence', get_color, lambda _, v: len(v) - 100)
-    do_dots_logic('_bitmask', get_color, lambda *_: 1 << 30)
-    do_pacman_movement_logic(grid_to_tile_type)
-    do_ghost_movement_logic(grid_to_tile_type)
-    do_ghost_eye_movement_logic(get_color, 0)
-    do_ghost_eye_movement_logic(get_color, 1)
-    do_ghost_eye_movement_logic(get_color, 2)
-    do_ghost_eye_movement_logic(get_color, 3)
-
-
-def load_grid(get_color) -> dict[Point, TileType]:
+    parser = argparse.ArgumentParser(description='Builds all blueprints into /data/')
+    parser.add_argument('--force', action='store_true', help='Rebuild every artifact, even if it\'s inputs have not changed')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help='Number of processes used to run stages in parallel')
+    parser.add_argument('--only', type=str, default=None, help='Only build artifacts matching this pattern, i.e. \'ghost/*\' or \'pacman/d_move\'')
+    parser.add_argument('--no-check', action='store_true', help='Skip checking the built LUTs against their reference models, and their latency, see checks.py and timing.py')
+    parser.add_argument('--compare-costs', type=str, default=None, help='Fail if any artifact\'s costs grew past `--cost-threshold`, compared to this costs.json')
+    parser.add_argument('--cost-threshold', type=float, default=0.1, help='Allowed relative growth of each cost, i.e. 0.1 = 10%%')
+    parser.add_argument('--trace', type=str, default=os.environ.get(TRACE_ENV), help='Write a Chrome trace of the build to this path, also enabled by $%s' % TRACE_ENV)
+    parser.add_argument('--dump-templates', action='store_true', help='Also save the JSON of each blueprint template, for inspection')
+    args = parser.parse_args()
+
+    os.makedirs('data', exist_ok=True)
+    if args.trace is not None:
+        enable_tracing()
+    if args.dump_templates:
+        dump_templates()
+
+    # Build Graph
+    # Palette -> Textures -> Grid, Eye Paths -> All other artifacts, which are independent of each other
+    walls = (Color.BLUE, Color.PINK)
+    stages = [
+        Stage('palette', load_palette, cache=False),
+        Stage('texture', load_texture, ('assets/texture.png', WIDTH, HEIGHT + 5, 5), ('palette',), cache=False),
+        Stage('bg_texture', load_texture, ('assets/background.png', WIDTH, HEIGHT), ('palette',), cache=False),
+        Stage('text_texture', load_texture, ('assets/text.png', 32, 10), ('palette',), cache=False),
+        Stage('grid', load_grid, requires=('texture',), cache=False),
+        Stage('eye_paths', eye_paths, requires=('texture',), cache=False),
+
+        Stage('background/game', do_background, ('background/game', walls), ('texture',)),
+        Stage('background/victory', do_background, ('background/victory', walls, Color.WHITE), ('texture',)),
+        Stage('background/title', do_background, ('background/title', tuple(c for c in Color if c != Color.BLACK)), ('bg_texture',)),
+        Stage('background/packed/game', do_background, ('background/game', walls, None, True), ('texture',)),
+        Stage('background/packed/victory', do_background, ('background/victory', walls, Color.WHITE, True, (walls, None)), ('texture',)),
+        Stage('background/packed/title', do_background, ('background/title', tuple(c for c in Color if c != Color.BLACK), None, True), ('bg_texture',)),
+        Stage('text/ready', do_text, ('text/ready', 0), ('text_texture',)),
+        Stage('text/game_over', do_text, ('text/game_over', 5), ('text_texture',)),
+        Stage('dots_*', do_bitplane_logic, ('dots', dots_mask, (('_values', 'word'), ('_sequence', 'sequence'), ('_bitmask', 'flag'))), ('texture',)),
+        Stage('pacman/*', do_pacman_movement_logic, requires=('grid',)),
+        Stage('ghost/*', do_ghost_movement_logic, requires=('grid',)),
+        Stage('ghost/path_lookup_0', do_ghost_eye_movement_logic, (0,), ('eye_paths',)),
+        Stage('ghost/path_lookup_1', do_ghost_eye_movement_logic, (1,), ('eye_paths',)),
+        Stage('ghost/path_lookup_2', do_ghost_eye_movement_logic, (2,), ('eye_paths',)),
+        Stage('ghost/path_lookup_3', do_ghost_eye_movement_logic, (3,), ('eye_paths',)),
+        Stage('ghost/banked/path_lookup_0', do_ghost_eye_movement_logic, (0, 'banked'), ('eye_paths',)),
+        Stage('ghost/banked/path_lookup_1', do_ghost_eye_movement_logic, (1, 'banked'), ('eye_paths',)),
+        Stage('ghost/banked/path_lookup_2', do_ghost_eye_movement_logic, (2, 'banked'), ('eye_paths',)),
+        Stage('ghost/banked/path_lookup_3', do_ghost_eye_movement_logic, (3, 'banked'), ('eye_paths',)),
+        Stage('ghost/packed/path_lookup_0', do_ghost_eye_movement_logic, (0, 'packed'), ('eye_paths',)),
+        Stage('ghost/packed/path_lookup_1', do_ghost_eye_movement_logic, (1, 'packed'), ('eye_paths',)),
+        Stage('ghost/packed/path_lookup_2', do_ghost_eye_movement_logic, (2, 'packed'), ('eye_paths',)),
+        Stage('ghost/packed/path_lookup_3', do_ghost_eye_movement_logic, (3, 'packed'), ('eye_paths',)),
+        Stage('ghost/shared/path_lookup', do_ghost_eye_movement_shared_logic, requires=('eye_paths',)),
+        Stage('pacman/packed/tile_type', do_entity_tile_type_logic, ('pacman/tile_type', tuple(TileType.all_player_tiles()), TileType.to_player_type, 'packed'), ('grid',)),
+        Stage('ghost/packed/tile_type', do_entity_tile_type_logic, ('ghost/tile_type', tuple(TileType), None, 'packed'), ('grid',)),
+    ]
+
+    cache = BuildCache('data/manifest.json', args.force)
+    run_stages(stages, cache, args.jobs, args.only)
+    cache.save()
+    if args.trace is not None:
+        write_trace(args.trace)
+    costs = cache.costs()
+    write_if_changed('data/costs.json', json.dumps(costs, indent=4, sort_keys=True))
+
+    if args.compare_costs is not None:
+        with open(args.compare_costs, 'r', encoding='utf-8') as f:
+            regressions = compare_costs(json.load(f), costs, args.cost_threshold)
+        for regression in regressions:
+            print('COST REGRESSION', regression)
+        if regressions:
+            raise ValueError('%d costs grew past the threshold of %d%%' % (len(regressions), round(args.cost_threshold * 100)))
+
+    # Check the built LUTs against their reference models. Imported here, as `checks` imports from this module
+    if args.only is None and not args.no_check:
+        from checks import check_all
+        from timing import check_timing
+        check_all()
+        check_timing()
+
+
+def run_stages(stages: list['Stage'], cache: 'BuildCache', jobs: int = 1, only: str | None = None):
+    """
+    Runs all `stages` in dependency order, with independent stages ran in parallel across `jobs` processes.
+    If `only` is provided, only artifacts matching that pattern, and the stages they require, are ran.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    selected: set[str] = set()
+    queue = [stage.name for stage in stages if only is None or fnmatch.fnmatch(stage.name, only) or fnmatch.fnmatch(only, stage.name)]
+    while queue:
+        name = queue.pop()
+        assert name in by_name, 'Unknown stage: %s' % name
+        if name not in selected:
+            selected.add(name)
+            queue += by_name[name].requires
+
+    pending: list[Stage] = [stage for stage in stages if stage.name in selected]
+    running: dict[Future, tuple[Stage, str | None]] = {}
+    results: dict[str, Any] = {}
+    executor = ProcessPoolExecutor(jobs, initializer=enable_tracing if TRACE_EVENTS is not None else None) if jobs > 1 else None
+    try:
+        while pending or running:
+            for stage in [stage for stage in pending if all(r in results for r in stage.requires)]:
+                pending.remove(stage)
+                inputs = tuple(results[r] for r in stage.requires) + stage.args
+                key = BuildCache.hash(stage.generator, *inputs) if stage.cache else None
+                if stage.cache and cache.is_up_to_date(stage.name, key):
+                    print('UP TO DATE', stage.name)
+                    results[stage.name] = None
+                    continue
+
+                if executor is None:
+                    future = Future()
+                    future.set_result(run_stage(stage.name, stage.generator, inputs))
+                else:
+                    future = executor.submit(run_stage, stage.name, stage.generator, inputs)
+                running[future] = stage, key
+            
+            assert running or not pending, 'Cyclic requirements in stages: %s' % [stage.name for stage in pending]
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, key = running.pop(future)
+                results[stage.name], outputs, costs, events = future.result()
+                if TRACE_EVENTS is not None:
+                    TRACE_EVENTS.extend(events)
+                if stage.cache:
+                    cache.update(stage.name, key, outputs, costs)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def run_stage(name: str, generator, args: tuple) -> tuple[Any, list[str], dict[str, dict], list[dict]]:
+    """
+    Runs a single stage (possibly in a worker process), returning it's result, all outputs it wrote with their costs,
+    and if tracing, the trace events it recorded (which are removed from this process's events, to be merged by the caller)
+    """
+    start = len(OUTPUTS)
+    try:
+        if TRACE_EVENTS is None:
+            return generator(*args), OUTPUTS[start:], {path: COSTS[path] for path in OUTPUTS[start:] if path in COSTS}, []
+
+        first, counters = len(TRACE_EVENTS), dict(TRACE_COUNTERS)
+        with trace_span(name, 'stage') as span:
+            result = generator(*args)
+            span.update({key: value - counters.get(key, 0) for key, value in TRACE_COUNTERS.items()})
+        events = TRACE_EVENTS[first:]
+        del TRACE_EVENTS[first:]
+        return result, OUTPUTS[start:], {path: COSTS[path] for path in OUTPUTS[start:] if path in COSTS}, events
+    finally:
+        clear_terms()  # Terms are only shared within a stage, see `Term`
+
+
+def enable_tracing():
+    """ Enables recording trace events and counters in this process, see `trace_span()` and `trace_count()` """
+    global TRACE_EVENTS, TRACE_COUNTERS
+    TRACE_EVENTS = []
+    TRACE_COUNTERS = defaultdict(int)
+
+
+@contextmanager
+def trace_span(name: str, category: str, **args):
+    """
+    Records a complete ('X') Chrome trace event for the duration of the block, if tracing is enabled. Yields the `args`
+    of the event, which may be updated within the block.
+    """
+    if TRACE_EVENTS is None:
+        yield args
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield args
+    finally:
+        end = time.perf_counter_ns()
+        TRACE_EVENTS.append({
+            'name': name, 'cat': category, 'ph': 'X', 'ts': start / 1000, 'dur': (end - start) / 1000,
+            'pid': os.getpid(), 'tid': os.getpid(), 'args': args,
+        })
+
+
+def trace_count(name: str, value: int = 1):
+    """ Adds `value` to the counter `name`, if tracing is enabled """
+    if TRACE_COUNTERS is not None:
+        TRACE_COUNTERS[name] += value
+
+
+def write_trace(path: str):
+    """
+    Writes all recorded trace events as Chrome trace event JSON (for chrome://tracing, or https://ui.perfetto.dev), with
+    the counters of each stage summed as a counter ('C') event at the end of the build.
+    """
+    totals: dict[str, int] = defaultdict(int)
+    for event in TRACE_EVENTS:
+        if event['cat'] == 'stage':
+            for key, value in event['args'].items():
+                totals[key] += value
+    end = max((event['ts'] + event['dur'] for event in TRACE_EVENTS), default=0)
+    events = TRACE_EVENTS + [{'name': 'counters', 'ph': 'C', 'ts': end, 'pid': os.getpid(), 'args': dict(totals)}]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    print('TRACE %s: %d events, %s' % (path, len(events), ', '.join('%s=%d' % item for item in sorted(totals.items()))))
+
+
+def compare_costs(baseline: dict[str, dict], costs: dict[str, dict], threshold: float) -> list[str]:
+    """ Every cost of an artifact which grew by more than `threshold` (relative) from `baseline` """
+    regressions = []
+    for path, metrics in sorted(costs.items()):
+        for metric, value in sorted(metrics.items()):
+            before = baseline.get(path, {}).get(metric)
+            if before is not None and value > before * (1 + threshold):
+                regressions.append('%s %s: %d -> %d (+%.0f%%)' % (path, metric, before, value, 100 * (value - before) / max(before, 1)))
+    return regressions
+
+
+def load_grid(texture: 'ColorGrid') -> dict[Point, TileType]:
     # Map Logic
     # Parse out the fully connected map consisting of all WHITE, GRAY, RED, YELLOW, CYAN pixels
-    grid: set[Point] = set()  # All grid positions
-    grid_ghost_restrict: set[Point] = set()  # Positions that restrict ghost's upward movement (YELLOW)
-    grid_ghost_slow: set[Point] = set()  # Positions that slow a ghost's movement (CYAN)
-    for x in range(WIDTH):
-        for y in range(HEIGHT):
-            px = get_color(x, y)
-            if Color.is_any_path_color(px):
-                grid.add((x, y))
-            if px == Color.YELLOW:
-                grid_ghost_restrict.add((x, y))
-            if px == Color.CYAN:
-                grid_ghost_slow.add((x, y))
-            if px == Color.RED:
-                print('BIG DOT', (x, y))
+    grid = texture.mask(*Color.path_colors())  # All grid positions
+    grid_ghost_restrict = texture.mask(Color.YELLOW)  # Positions that restrict ghost's upward movement (YELLOW)
+    grid_ghost_slow = texture.mask(Color.CYAN)  # Positions that slow a ghost's movement (CYAN)
+    for x, y in np.argwhere(texture.mask(Color.RED)).tolist():
+        print('BIG DOT', (x, y))
     
+    # Connections of each position to it's neighbors, computed over the whole grid at once
+    padded = np.pad(grid, 1)
+    grid_up = padded[1:-1, :-2]
+    grid_down = padded[1:-1, 2:]
+    grid_left = padded[:-2, 1:-1]
+    grid_right = padded[2:, 1:-1]
+
     # Grid -> Tile Mapping
     # Map each grid point to a tile type
     grid_to_tile_type: dict[Point, TileType] = {}
-    for pos in grid:
-        x, y = pos
-        connect_up = (x, y - 1) in grid
-        connect_down = (x, y + 1) in grid
-        connect_left = (x - 1, y) in grid
-        connect_right = (x + 1, y) in grid
+    for pos in map(tuple, np.argwhere(grid).tolist()):
+        connect_up = bool(grid_up[pos])
+        connect_down = bool(grid_down[pos])
+        connect_left = bool(grid_left[pos])
+        connect_right = bool(grid_right[pos])
 
-        if pos in grid_ghost_restrict:
+        if grid_ghost_restrict[pos]:
             assert connect_up and connect_left and connect_right and not connect_down, 'grid_ghost_restrict must be T_DOWN'
             grid_to_tile_type[pos] = TileType.T_DOWN_GHOST_RESTRICT
             continue
         
-        if pos in grid_ghost_slow:
+        if grid_ghost_slow[pos]:
             match (connect_up, connect_down, connect_left, connect_right):
                 case (False, False, True, True):
                     grid_to_tile_type[pos] = TileType.STRAIGHT_H_GHOST_SLOW
@@ -173,18 +380,34 @@ def load_grid(get_color) -> dict[Point, TileType]:
     return grid_to_tile_type
 
 
-def do_background(name: str, get_color):
+def do_background(
+        texture: 'ColorGrid',
+        name: str,
+        colors: tuple[Color, ...],
+        color: Color | None = None,
+        packed: bool = False,
+        base: tuple[tuple[Color, ...], Color | None] | None = None
+    ):
     """
-    Builds a background sprite.
-    - `encode_all = False` : Only considers BLUE + PINK pixels part of the background
-    - `encode_all = True`  : Considers all pixels not BLACK part of the background
+    Builds a background sprite, from all pixels of `texture` in `colors`, optionally recolored to `color`.
+
+    If `packed`, every `BACKGROUND_PIXELS` pixels of a row are packed into one signal, as 4-bit colors (the same as the
+    sprite data on G0) with the leftmost pixel in the lowest bits, and it is written to `background/packed/<name>`.
+    If `base` is given, as the `(colors, color)` of another background of `texture`, only the difference to that base is
+    written, so the base plus this delta, summed on the wire, is this background. This only saves filters where pixels
+    are unchanged from the base, so i.e. the victory background (every wall recolored) is no smaller than it's base.
     """
+    pixels = full = background_pixels(texture, colors, color)
+    if base is not None:
+        pixels = full - background_pixels(texture, *base)
+    if packed:
+        pixels, full = pack_pixels(pixels), pack_pixels(full)
+        prefix, suffix = name.rsplit('/', 1)
+        name = '%s/packed/%s' % (prefix, suffix)
+
     # Background
-    # Create the 'background' blueprint, based on BLUE + PINK pixels
-    bp = decode_and_write(
-        '0eNrtml9P2zAUxb+Lny8o107SphKv+xIIVWlrwFqbVI4Lq1C++3xtVhhjbPKfN6svyWnj341zenRUeGGb/UketRoMW70wtR2Hia1uX9ikHoZ+T9rQHyRbsZ3cqp3UV9vxsFFDb0bNZmBq2MkfbIUzfHIJLWb6wXx+DZ/vgMnBKKOkZ7qT83o4HTZS20Xhq4WAHcfJXjsORLTrXfHqugF2piPRXjeWtFNabv1HlkCrGD3u1xv52D8pu4S9bvLvT78f21kuN3Y3z3RzH2bj8MW+fD3a/w32uuzavrdTlxHfn9kh75WezPpt3835SCM9KW1OVrnM6D9x9Y12/9deuv21Qx977YZesRt7wfsV14M0z6P+7sha7tjK6JME9qCltIPf9/tJzvQQx5M5nsxH3/xjGPkk9dk8quGBpvoD5Va/sAg8/+VRiAibYGab1OE2qYpNktqkCbcJz50mbbBNeEmTtDZZRNgkd5osw21S0iStTbpwm2DuNMEq2CdY4iStTzCixGLuPMHwFoslUBIbJaLGVtkTJbzHViVREhsloshW2RMlvMlWJVESGyW8ymKXPVGCuyx2JVESG6WLMEruROFVuFFKoqQ1Cg8vs7jM/otscJnFZUmUxEYREUbJnih1uFFKoiQ2SniZxUX2RAkus7goiZLYKBFldpE9UcLL7KIkSmKjRJTZNneiiPAy25ZESfxn44gy2+ZOFBFeZtuSKImNElFmm+yJEl5mm5IoiY0SUWab7IkSXmabkiiJjRJRZuvsiRJeZuuSKDFGsbhnu3kEu0Xg9LqDWw4INaA9ElapnWbPoXVaY7XWafYclk5bWG3pNHsOWDmxs6I9JJUUQO5kJBB6EkmAnoUEQ08jCdDzkIDoiSQBeiYSFD2VJOAei8TlnksScM/l7gZf75C43HM5cbnnkgTcczlxueeSBNxzOXG555IEwnM5cYXnkgTCcwVxheeSBOJ1b4krPJckEJ4riCs8lyQQniuIK4hrn5oy8mCf/tt/0gKzDpjcd6BpeVd3XdPwphUc5/knqJDWIA==',
-        'background'
-    )
+    # Create the 'background' blueprint, with a constant combinator for every 5 rows, and rows stored as qualities
+    bp = template('background')
     rows = sorted(
         [
             e
@@ -201,78 +424,124 @@ def do_background(name: str, get_color):
         else:
             values = obj['filters']
         
-        for x in range(WIDTH):
-            px = get_color(x, y)
-            if px is not None:
-                values.append({
-                    'index': len(values) + 1,
-                    'name': CONSTANTS[x],
-                    'quality': QUALITY[y % 5],
-                    'comparator': '=',
-                    'count': px
-                })
+        row = pixels[:, y]
+        for x in np.flatnonzero(row).tolist():
+            values.append({
+                'index': len(values) + 1,
+                'name': CONSTANTS[x],
+                'quality': QUALITY[y % 5],
+                'comparator': '=',
+                'count': int(row[x])
+            })
     
+    if base is not None:
+        print('BACKGROUND %s: %d filters, vs %d without the base' % (name, int(np.count_nonzero(pixels)), int(np.count_nonzero(full))))
+    elif packed:
+        print('BACKGROUND %s: %d filters' % (name, int(np.count_nonzero(pixels))))
     encode_and_write(bp, name)
 
 
-def do_text(name: str, get_color, y_offset: int):
+def background_pixels(texture: 'ColorGrid', colors: tuple[Color, ...], color: Color | None = None) -> np.ndarray:
+    """ The [x, y] colors of all pixels of `texture` in `colors`, optionally recolored to `color`, and 0 elsewhere """
+    array = texture.where(texture.mask(*colors), color).array
+    return np.where(array != ColorGrid.NONE, array, 0).astype(np.int64)
+
+
+def pack_pixels(pixels: np.ndarray) -> np.ndarray:
+    """
+    Packs [x, y] 4-bit colors into [x // BACKGROUND_PIXELS, y] words, where pixel x is bits `4 * (x % BACKGROUND_PIXELS)`.
+    Packing is linear, so packed deltas (which may be negative) still sum on the wire to the packed sum.
+    """
+    width = -(-pixels.shape[0] // BACKGROUND_PIXELS) * BACKGROUND_PIXELS
+    padded = np.zeros((width, pixels.shape[1]), dtype=np.int64)
+    padded[:pixels.shape[0]] = pixels
+    shifts = 4 * np.arange(BACKGROUND_PIXELS)[None, :, None]
+    return (padded.reshape(-1, BACKGROUND_PIXELS, pixels.shape[1]) << shifts).sum(axis=1)
+
+
+def do_text(texture: 'ColorGrid', name: str, y_offset: int):
     bp, values = load_blueprint_single_combinator()
 
-    for x in range(TEXT_WIDTH):
-        for y in range(TEXT_HEIGHT):
-            px = get_color(x, y + y_offset)
-            if px is not None:
-                values.append({
-                    'index': len(values) + 1,
-                    'name': CONSTANTS[TEXT_X + x],
-                    'quality': QUALITY[y],
-                    'comparator': '=',
-                    'count': px
-                })
+    text = texture.array[:TEXT_WIDTH, y_offset:y_offset + TEXT_HEIGHT]
+    for x, y in np.argwhere(text != ColorGrid.NONE).tolist():
+        values.append({
+            'index': len(values) + 1,
+            'name': CONSTANTS[TEXT_X + x],
+            'quality': QUALITY[y],
+            'comparator': '=',
+            'count': int(text[x, y])
+        })
     
     encode_and_write(bp, name)
 
 
-def do_dots_logic(name: str, get_color, formula):
-    # Foreground
-    # Includes all WHITE pixels representing the individual dots
-    bp, values = load_blueprint_single_combinator()
+def do_bitplane_logic(
+        texture: 'ColorGrid',
+        name: str,
+        layer: Callable[['ColorGrid'], np.ndarray],
+        variants: tuple[tuple[str, str], ...],
+        stride: int = 3,
+        offset: int = 1
+    ):
+    """
+    Encodes the positions of `layer(texture)` as bitplanes, in a single constant combinator, and writes it to
+    /data/<name><suffix>.txt for each `(suffix, count)` of `variants`, where `count` is the count of each word's signal:
+    - `word`     : The word itself
+    - `sequence` : The index of the word, from -100
+    - `flag`     : A single bit above the word, so only which signals are present is used
+    See `bitplanes()` for how positions are packed into words.
+    """
+    mask = layer(texture)
+    words = bitplanes(mask, stride, offset)
+    print('BITPLANES %s: %d positions, %d words' % (name, int(mask.sum()), int(np.count_nonzero(words))))
 
-    count = 0
-    for x in range(WIDTH):
-        value = 0
-        
-        for y in range(HEIGHT):
-            px = get_color(x, y)
-            if px == Color.WHITE or (px == Color.YELLOW and y != 34):
-                y_index = ((y // 3) - 1)
-                assert y_index < 30
-                value |= 1 << y_index
-                count += 1
-      
-        if value != 0:
+    for suffix, count in variants:
+        bp, values = load_blueprint_single_combinator()
+        for x, w in np.argwhere(words != 0).tolist():
             values.append({
                 'index': len(values) + 1,
                 'name': CONSTANTS[x],
-                'quality': 'normal',
+                'quality': QUALITY[w],
                 'comparator': '=',
-                'count': formula(value, values)
+                'count': {'word': int(words[x, w]), 'sequence': len(values) - 100, 'flag': 1 << BITPLANE_BITS}[count]
             })
+        encode_and_write(bp, name + suffix)
+
+
+def bitplanes(mask: np.ndarray, stride: int, offset: int) -> np.ndarray:
+    """
+    Packs a [x, y] mask into [x, word] words, where each row y is bit `i % BITPLANE_BITS` of word `i // BITPLANE_BITS`,
+    for `i = y // stride - offset`. So a column spanning more than `BITPLANE_BITS` rows is split across words, which are
+    stored as the qualities of it's signal.
+    """
+    index = np.arange(mask.shape[1]) // stride - offset
+    xs, ys = np.nonzero(mask)
+    assert ys.size == 0 or index[ys].min() >= 0, 'Positions above row %d are not encodable' % (offset * stride)
 
-    if name == '':
-        print('DOTS', count)
-    encode_and_write(bp, 'dots' + name)
+    count = 1 if ys.size == 0 else 1 + int(index[ys].max()) // BITPLANE_BITS
+    assert count <= len(QUALITY), 'Bitplanes need %d words per column, but a signal only has %d qualities' % (count, len(QUALITY))
+    words = np.zeros((mask.shape[0], count), dtype=np.int64)
+    np.bitwise_or.at(words, (xs, index[ys] // BITPLANE_BITS), np.left_shift(1, index[ys] % BITPLANE_BITS))
+    return words
+
+
+def dots_mask(texture: 'ColorGrid') -> np.ndarray:
+    """ All positions with a dot, which are WHITE pixels, and YELLOW pixels (besides the ghost door) """
+    return texture.mask(Color.WHITE) | (texture.mask(Color.YELLOW) & (np.arange(HEIGHT) != 34))
 
 
 def do_entity_tile_type_logic(
-        name: str,
         grid_to_tile_type: dict[Point, Color],
+        name: str,
         tile_type_set: set[TileType],
-        tile_type_filter
+        tile_type_filter = None,
+        backend: str = 'decider'
     ):
     """
-    Builds the logic used for tile type detection
+    Builds the logic used for tile type detection, using one of the backends of `write_position_lut()`
     """
+    if tile_type_filter is None:
+        tile_type_filter = lambda x: x
     
     acc = Accounter('TileMap[X, Y]')
     tile: TileType = Term('T')
@@ -281,14 +550,269 @@ def do_entity_tile_type_logic(
     for tile_type in tile_type_set:
         acc.by_output[tile == tile_type] = Term3([])
 
-    # Then add each tile type by position
-    for (x, y), tile_type in grid_to_tile_type.items():
-        acc.if_then(
-            (Term('X') == x) & (Term('Y') == y),
-            tile == tile_type_filter(tile_type)
-        )
+    # Then add each tile type by position, merging positions into ranges
+    table: dict[Point, TileType] = {pos: tile_type_filter(tile_type) for pos, tile_type in grid_to_tile_type.items()}
+    write_position_lut(name, acc, table, 'T', backend)
+
+
+def write_position_lut(name: str, acc: 'Accounter', table: dict[Point, int], output: str, backend: str):
+    """
+    Writes a LUT from (X, Y) -> `output`, to /data/<name>.txt, using one of the following backends:
+    - `decider` : A decider combinator for each output value, see `Accounter.build()`
+    - `banked`  : Decider combinators split into banks of `BANK_WIDTH` columns, see `Accounter.build_banked()`
+    - `packed`  : Values packed into constant combinators, and looked up with arithmetic, see `build_packed()`
+
+    `acc` should have an output for each value in `table`, to which the positions of that value are added.
+    """
+    if backend != 'decider':
+        prefix, suffix = name.rsplit('/', 1)
+        name = '%s/%s/%s' % (prefix, backend, suffix)
+
+    if backend == 'packed':
+        bp = build_packed(table, output, acc.text)
+        print('PACKED %s: %d constants' % (name, sum(len(e['control_behavior']['sections']['sections'][0].get('filters', [])) for e in bp['blueprint']['entities'] if e['name'] == 'constant-combinator')))
+    else:
+        for value, positions in group_by_value(table).items():
+            acc.if_then(position_ranges(positions), Term(output) == value)
+
+        print('RANGES %s: %d -> %d conditions' % (name, 2 * len(table), acc.conditions()))
+        if backend == 'decider':
+            bp = acc.build()
+        elif backend == 'banked':
+            bp = acc.build_banked(BANK_WIDTH)
+            print('BANKED %s: %d banks, at most %d conditions per bank' % (name, *Accounter.bank_conditions(bp)))
+        else:
+            raise ValueError('Unknown backend: %s' % backend)
+
+    encode_and_write(bp, name)
+    COSTS[f'data/{name}.txt']['conditions_per_tick'] = conditions_per_tick(bp, table)
+
+
+def conditions_per_tick(blueprint: dict, table: dict[Point, int]) -> int:
+    """
+    The mean number of conditions evaluated per tick by a LUT from (X, Y), over the positions of `table`, see
+    `Circuit.evaluations()`. Unlike the total number of conditions, this counts a bank which is not selected (see
+    `Accounter.build_banked()`) as only the conditions it evaluates against an empty network.
+    """
+    from simulator import Circuit  # Imported here, as `simulator` imports from this module
+    xs, ys = np.array(list(table)).T
+    inputs = {'X': xs, 'Y': ys}
+    circuit = Circuit(blueprint, inputs)
+    return round(sum(float(count.mean()) for count in circuit.evaluations(red=inputs).values()))
+
+
+def build_packed(table: dict[Point, int], output: str, text: str = '') -> dict:
+    """
+    Builds a BP JSON for a LUT from (X, Y) -> `output`, where the values are bit packed into constant combinators.
+
+    Each value uses `bits` bits, with `k = 31 // bits` values packed into a word, by Y, LSB first. Each column X has a
+    word for every `k` rows, with the word `w` on the signal for that column (see `CONSTANTS`) with quality `w % 5`, in
+    the constant combinator `w // 5`, which we call a plane. The lookup is then fixed cost, regardless of the table size:
+
+    ```
+    plane = Y / (5 * k)                  # Gate the plane's constant combinator, by Y
+    index = (X + 1) * 8 + (Y / k) % 5    # Select the word, where each word signal has this index in an index combinator
+    shift = (Y % k) * bits
+    value = (word >> shift) AND mask
+    ```
+    Inputs X, Y are read on the red input, and must be held for 5 ticks, the combinator depth of the longest chain
+    (Y / k -> % 5 -> select -> shift -> AND, as measured by `timing.depth()`). The value is output on `output`.
+    """
+    assert all(value >= 0 for value in table.values()), 'Packed LUT requires non-negative values'
+    assert all(0 <= x < len(CONSTANTS) and y >= 0 for x, y in table), 'Packed LUT requires positions in [0, %d) x [0, inf)' % len(CONSTANTS)
+
+    bits = max(1, max(table.values(), default=0).bit_length())
+    k = 31 // bits
+    mask = (1 << bits) - 1
+    width = 1 + max(x for x, _ in table)
+    words_per_column = -(-(1 + max(y for _, y in table)) // k)
+    planes = -(-words_per_column // len(QUALITY))
+
+    # Pack values into words, indexed by [x, word]
+    values = np.zeros((width, words_per_column * k), dtype=np.int64)
+    for (x, y), value in table.items():
+        values[x, y] = value
+    words = (values.reshape(width, words_per_column, k) << (np.arange(k) * bits)).sum(axis=2)
     
-    encode_and_write(acc.build(), name)
+    # Check each value can be unpacked again
+    for (x, y), value in table.items():
+        assert (int(words[x, y // k]) >> ((y % k) * bits)) & mask == value
+
+    bp = template('lut')
+    bp['blueprint']['entities'] = entities = []
+    bp['blueprint']['wires'] = wires = []
+    prefix = text + ': ' if text else ''
+
+    def virtual(name: str) -> dict:
+        return {'type': 'virtual', 'name': 'signal-%s' % name}
+
+    def constant_combinator(x: float, y: float, filters: list[dict], description: str) -> int:
+        entities.append({
+            'entity_number': len(entities) + 1,
+            'name': 'constant-combinator',
+            'position': {'x': x, 'y': y},
+            'direction': 8,
+            'control_behavior': {'sections': {'sections': [{'index': 1, 'filters': filters}]}},
+            'player_description': prefix + description
+        })
+        return len(entities)
+
+    def combinator(x: float, kind: str, conditions: dict, description: str) -> int:
+        entities.append({
+            'entity_number': len(entities) + 1,
+            'name': kind,
+            'position': {'x': x, 'y': 2},
+            'direction': 8,
+            'control_behavior': conditions,
+            'player_description': prefix + description
+        })
+        return len(entities)
+
+    def arithmetic(x: float, first: str, operation: str, second: int | str, out: str, description: str) -> int:
+        conditions = {
+            'first_signal': virtual(first),
+            'first_signal_networks': {'red': True, 'green': False},
+            'operation': operation,
+            'output_signal': virtual(out)
+        }
+        if isinstance(second, int):
+            conditions['second_constant'] = second
+        else:
+            conditions['second_signal'] = virtual(second)
+            conditions['second_signal_networks'] = {'red': False, 'green': True}
+        return combinator(x, 'arithmetic-combinator', {'arithmetic_conditions': conditions}, description)
+
+    # Planes, each a constant combinator, gated by a decider which passes it's words through when Y is within the plane
+    gates = []
+    for plane in range(planes):
+        filters = []
+        for x in range(width):
+            for w in range(plane * len(QUALITY), min(words_per_column, (plane + 1) * len(QUALITY))):
+                if words[x, w] != 0:
+                    filters.append({
+                        'index': len(filters) + 1,
+                        'name': CONSTANTS[x],
+                        'quality': QUALITY[w % len(QUALITY)],
+                        'comparator': '=',
+                        'count': int(words[x, w])
+                    })
+        lo, hi = plane * len(QUALITY) * k, (plane + 1) * len(QUALITY) * k - 1
+        constant = constant_combinator(plane + 0.5, 0.5, filters, 'Plane %d, Y in [%d, %d]' % (plane, lo, hi))
+        gate = combinator(plane + 0.5, 'decider-combinator', {
+            'decider_conditions': {
+                'conditions': [],
+                'outputs': [{'signal': virtual('everything'), 'networks': {'red': False, 'green': True}}]
+            }
+        }, 'Gate Plane %d' % plane)
+        Accounter.conditions_of(entities[-1], (Term('Y') >= lo) & (Term('Y') <= hi))
+        wires.append([constant, 2, gate, 2])
+        if gates:
+            wires.append([gates[-1], 1, gate, 1])  # Input (X, Y)
+            wires.append([gates[-1], 3, gate, 3])  # Output (words)
+        gates.append(gate)
+    
+    # Index of each word signal, used to select the word
+    index = constant_combinator(planes + 0.5, 0.5, [
+        {
+            'index': i + 1,
+            'name': CONSTANTS[x],
+            'quality': QUALITY[q],
+            'comparator': '=',
+            'count': (x + 1) * 8 + q
+        }
+        for i, (x, q) in enumerate((x, q) for x in range(width) for q in range(len(QUALITY)))
+    ], 'Word Index')
+
+    # Key = (X + 1) * 8 + (Y / k) % 5, summed on the wire from two arithmetic chains
+    a1 = arithmetic(planes + 1.5, 'Y', '/', k, 'K', 'Y / %d' % k)
+    a2 = arithmetic(planes + 2.5, 'K', '%', len(QUALITY), 'K', 'K %% %d' % len(QUALITY))
+    a3 = arithmetic(planes + 3.5, 'X', '+', 1, 'K', 'X + 1')
+    a4 = arithmetic(planes + 4.5, 'K', '*', 8, 'K', 'K * 8')
+
+    # Selects the word with index = K, from the planes
+    select = combinator(planes + 5.5, 'decider-combinator', {
+        'decider_conditions': {
+            'conditions': [{
+                'first_signal': virtual('each'),
+                'first_signal_networks': {'red': False, 'green': True},
+                'comparator': '=',
+                'second_signal': virtual('K'),
+                'second_signal_networks': {'red': True, 'green': False}
+            }],
+            'outputs': [{'signal': virtual('each'), 'networks': {'red': True, 'green': False}}]
+        }
+    }, 'Select Word')
+
+    # Shift = (Y % k) * bits
+    a5 = arithmetic(planes + 6.5, 'Y', '%', k, 'S', 'Y %% %d' % k)
+    a6 = arithmetic(planes + 7.5, 'S', '*', bits, 'S', 'S * %d' % bits)
+
+    # Value = (word >> shift) AND mask
+    shift = combinator(planes + 8.5, 'arithmetic-combinator', {'arithmetic_conditions': {
+        'first_signal': virtual('each'),
+        'first_signal_networks': {'red': True, 'green': False},
+        'second_signal': virtual('S'),
+        'second_signal_networks': {'red': False, 'green': True},
+        'operation': '>>',
+        'output_signal': virtual('each')
+    }}, 'Word >> S')
+    value = combinator(planes + 9.5, 'arithmetic-combinator', {'arithmetic_conditions': {
+        'first_signal': virtual('each'),
+        'first_signal_networks': {'red': True, 'green': False},
+        'second_constant': mask,
+        'operation': 'AND',
+        'output_signal': virtual(output)
+    }}, 'Output %s' % output)
+
+    wires += [
+        [gates[-1], 1, a1, 1], [a1, 1, a3, 1], [a3, 1, a5, 1],  # Input (X, Y), on red
+        [a1, 3, a2, 1], [a3, 3, a4, 1],  # Key chains
+        [a2, 3, a4, 3], [a4, 3, select, 1], [gates[-1], 3, select, 1],  # Key and words, on red
+        [index, 2, select, 2],  # Index, on green
+        [a5, 3, a6, 1],
+        [select, 3, shift, 1], [a6, 4, shift, 2],  # Word on red, shift on green
+        [shift, 3, value, 1],
+    ]
+    return bp
+
+
+def position_ranges(positions: set[Point]) -> 'Term3':
+    """
+    Builds a condition matching exactly `positions`, by merging adjacent positions into rectangles. Each rectangle
+    is then expressed as `X >= a & X <= b & Y >= c & Y <= d`, where each range of a single value uses `=` instead.
+    """
+    def grow(pos: Point, horizontal: bool) -> tuple[int, int, int, int]:
+        # Extend the run containing `pos`, in the first direction, then extend the run in the other direction
+        x0, y0 = x1, y1 = pos
+        if horizontal:
+            while (x0 - 1, y0) in positions: x0 -= 1
+            while (x1 + 1, y0) in positions: x1 += 1
+            while all((x, y0 - 1) in positions for x in range(x0, x1 + 1)): y0 -= 1
+            while all((x, y1 + 1) in positions for x in range(x0, x1 + 1)): y1 += 1
+        else:
+            while (x0, y0 - 1) in positions: y0 -= 1
+            while (x0, y1 + 1) in positions: y1 += 1
+            while all((x0 - 1, y) in positions for y in range(y0, y1 + 1)): x0 -= 1
+            while all((x1 + 1, y) in positions for y in range(y0, y1 + 1)): x1 += 1
+        return x0, x1, y0, y1
+
+    def between(term: 'Term', lo: int, hi: int) -> list['Term1']:
+        return [term == lo] if lo == hi else [term >= lo, term <= hi]
+
+    # Greedily cover each remaining position with whichever rectangle covers the most remaining positions per condition.
+    # Rectangles may overlap, as they all share the same output.
+    remaining = set(positions)
+    term = Term3([])
+    for pos in sorted(positions, key=lambda p: (p[1], p[0])):
+        if pos in remaining:
+            best = max(
+                (grow(pos, True), grow(pos, False)),
+                key=lambda r: sum((x, y) in remaining for x in range(r[0], r[1] + 1) for y in range(r[2], r[3] + 1)) / (len(between(Term('X'), r[0], r[1])) + len(between(Term('Y'), r[2], r[3])))
+            )
+            x0, x1, y0, y1 = best
+            remaining -= {(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)}
+            term.or_values.append(Term2(between(Term('X'), x0, x1) + between(Term('Y'), y0, y1)))
+    return term
 
 
 def do_pacman_movement_logic(grid_to_tile_type: dict[Point, Color]):
@@ -336,43 +860,43 @@ def do_pacman_movement_logic(grid_to_tile_type: dict[Point, Color]):
     ```
     """
 
-    tile: TileType = Term('T')
-    d1: Direction = Term('D1')
-    d2: Direction = Term('D2')
-    d3: Direction = Term('D3')
+    tile: TileType = Term('T', tuple(TileType.all_player_tiles()))
+    d1: Direction = Term('D1', Direction.all_or_none())
+    d2: Direction = Term('D2', Direction.all_or_none())
+    d3: Direction = Term('D3', Direction.all_or_none())
 
     # Compute the TileType[X, Y] map for the player
-    do_entity_tile_type_logic('pacman/tile_type', grid_to_tile_type, TileType.all_player_tiles(), TileType.to_player_type)
+    do_entity_tile_type_logic(grid_to_tile_type, 'pacman/tile_type', TileType.all_player_tiles(), TileType.to_player_type)
 
-    # Compute the can_move() functions for D1, D2, and D3, taking input the tile type and directions
-    # N.B. These structures compute can_move(DN), from the inputs tile and `DN`
-    encode_and_write(ai_can_move(tile, d1).build(), 'pacman/d1_can_move')
-    encode_and_write(ai_can_move(tile, d2).build(), 'pacman/d2_can_move')
-    encode_and_write(ai_can_move(tile, d3).build(), 'pacman/d3_can_move')
+    d1_can_move = Term('M1', (0, 1))  # 1 if can_move(D1)
+    d2_can_move = Term('M2', (0, 1))  # 1 if can_move(D2)
+    d3_can_move = Term('M3', (0, 1))  # 1 if can_move(D3)
 
-    d1_can_move = Term('M1')  # 1 if can_move(D1)
-    d2_can_move = Term('M2')  # 1 if can_move(D2)
-    d3_can_move = Term('M3')  # 1 if can_move(D3)
+    # Compute the can_move() functions for D1, D2, and D3, taking input the tile type and directions
+    # N.B. These structures compute can_move(DN) as MN, from the inputs tile and `DN`
+    encode_and_write(ai_can_move(tile, d1, d1_can_move).build(), 'pacman/d1_can_move')
+    encode_and_write(ai_can_move(tile, d2, d2_can_move).build(), 'pacman/d2_can_move')
+    encode_and_write(ai_can_move(tile, d3, d3_can_move).build(), 'pacman/d3_can_move')
 
     # --- Calculate d2_next ---
     d2_next = Accounter('D2 Next')
     d2_next.if_then(
         (d1 == -1) & (d2 == -1),
-        (d2, 'D2 <= -1')
+        (d2 == -1, 'D2 <= -1')
     )
     d2_next.if_then(
         (d1 != -1) & (d1_can_move == 1),
-        (d2, 'D2 <= D1')
+        (d2, 'D2 <= D1', d1)
     )
     d2_next.if_then(
         ((d1 == -1) & (d2 != -1) & (d3 == -1)) |
         ((d1 != -1) & (d2 != -1) & (d1_can_move == 0)) |
         ((d1 == -1) & (d2 != -1) & (d3 != -1) & (d3_can_move == 0)),
-        (d2, 'D2 <= D2')
+        (d2, 'D2 <= D2', d2)
     )
     d2_next.if_then(
         (d1 == -1) & (d2 != -1) & (d3 != -1) & (d3_can_move == 1),
-        (d2, 'D2 <= D3')
+        (d2, 'D2 <= D3', d3)
     )
     
     # --- Calculate d3_next ---
@@ -382,43 +906,45 @@ def do_pacman_movement_logic(grid_to_tile_type: dict[Point, Color]):
         ((d1 == -1) & (d2 != -1) & (d3 == -1)) |
         ((d1 != -1) & (d2 != -1) & (d1_can_move == 1)) |
         ((d1 == -1) & (d2 != -1) & (d3 != -1) & (d3_can_move == 1)),
-        (d3, 'D3 <= -1')
+        (d3 == -1, 'D3 <= -1')
     )
     d3_next.if_then(
         (d1 != -1) & (d2 != -1) & (d1_can_move == 0),
-        (d3, 'D3 <= D1')
+        (d3, 'D3 <= D1', d1)
     )
     d3_next.if_then(
         (d1 == -1) & (d2 != -1) & (d3 != -1) & (d3_can_move == 0),
-        (d3, 'D3 <= D3')
+        (d3, 'D3 <= D3', d3)
     )
     
     # --- Calculate move ---
-    d = Term('D')
+    d = Term('D', Direction.all_or_none())
     d_move = Accounter('D Move')
     d_move.if_then(
         ((d1 == -1) & (d2 == -1)) |
         ((d1 == -1) & (d2 != -1) & (d3 == -1) & (d2_can_move == 0)) |
         ((d1 != -1) & (d2 != -1) & (d1_can_move == 0) & (d2_can_move == 0)) |
         ((d1 == -1) & (d2 != -1) & (d3 != -1) & (d2_can_move == 0) & (d3_can_move == 0)),
-        (d, 'D_MOVE <= -1')
+        (d == -1, 'D_MOVE <= -1')
     )
     d_move.if_then(
         ((d1 != -1) & (d1_can_move == 1)) |
         ((d1 != -1) & (d2 != -1) & (d1_can_move == 1)),
-        (d, 'D_MOVE <= D1')
+        (d, 'D_MOVE <= D1', d1)
     )
     d_move.if_then(
         ((d1 == -1) & (d2 != -1) & (d3 == -1) & (d2_can_move == 1)) |
         ((d1 != -1) & (d2 != -1) & (d1_can_move == 0) & (d2_can_move == 1)) |
         ((d1 == -1) & (d2 != -1) & (d3 != -1) & (d3_can_move == 0) & (d2_can_move == 1)),
-        (d, 'D_MOVE <= D2')
+        (d, 'D_MOVE <= D2', d2)
     )
     d_move.if_then(
         (d1 == -1) & (d2 != -1) & (d3 != -1) & (d3_can_move == 1),
-        (d, 'D_MOVE <= D3')
+        (d, 'D_MOVE <= D3', d3)
     )
 
+    # Cases which pass through D1, D2 or D3 are wired to a rename of that input (see `Accounter.wire_sources()`), so each
+    # table reads just D1, D2, D3 and M1, M2, M3 on it's red input
     encode_and_write(d2_next.build(), 'pacman/d2_next')
     encode_and_write(d3_next.build(), 'pacman/d3_next')
     encode_and_write(d_move.build(), 'pacman/d_move')
@@ -441,8 +967,10 @@ def do_pacman_movement_logic(grid_to_tile_type: dict[Point, Color]):
 
 def ai_can_move(
         tile: 'TileType',
-        dir: 'Direction'
+        dir: 'Direction',
+        out: 'Term'
     ) -> 'Accounter':
+    """ can_move(`dir`) from the inputs tile and `dir`, as a single decider emitting `out` = 1 """
     can_move = Accounter()
     can_move.if_then(
         ((tile == TileType.STRAIGHT_H) & (dir == Direction.LEFT)) |
@@ -471,7 +999,7 @@ def ai_can_move(
         
         ((tile == TileType.EDGE_RIGHT) & (dir == Direction.LEFT)) |
         ((tile == TileType.EDGE_RIGHT) & (dir == Direction.RIGHT)),
-        'true'
+        out == 1
     )
     return can_move
 
@@ -511,19 +1039,19 @@ def do_ghost_movement_logic(grid_to_tile_type: dict[Point, Color]):
 
     """
 
-    tile: TileType = Term('T')
+    tile: TileType = Term('T', tuple(TileType))
 
     # Ghost Tile Type
-    do_entity_tile_type_logic('ghost/tile_type', grid_to_tile_type, TileType, lambda x: x)
+    do_entity_tile_type_logic(grid_to_tile_type, 'ghost/tile_type', TileType)
 
     # ----- Movement Logic -----
     # Ghost movement will always be one of straight, left, or right. We compute +1 | 0 | -1, add to D, then pass that
     # through logic to determine D' and X,Y
-    incoming_dir: Direction = Term('D')
-    flag_h: 0 | 1 = Term('H')
-    flag_v: 0 | 1 = Term('V')
-    flag_s1: 0 | 1 = Term('S1')
-    flag_s2: 0 | 1 = Term('S2')
+    incoming_dir: Direction = Term('D', tuple(Direction))
+    flag_h: 0 | 1 = Term('H', (0, 1))
+    flag_v: 0 | 1 = Term('V', (0, 1))
+    flag_s1: 0 | 1 = Term('S1', (0, 1))
+    flag_s2: 0 | 1 = Term('S2', (0, 1))
 
     acc = Accounter()
     acc.if_then(
@@ -633,8 +1161,8 @@ def do_ghost_movement_logic(grid_to_tile_type: dict[Point, Color]):
     encode_and_write(acc.build(), 'ghost/turn')
 
     # Frightened (Random) movement
-    r3: 0 | 1 | 2 = Term('R3')
-    r4: 0 | 1 | 2 | 3 = Term('R4')
+    r3: 0 | 1 | 2 = Term('R3', (0, 1, 2))
+    r4: 0 | 1 | 2 | 3 = Term('R4', (0, 1, 2, 3))
     outgoing_dir: Direction = Term('D')
 
     acc = Accounter()
@@ -710,7 +1238,30 @@ def do_ghost_movement_logic(grid_to_tile_type: dict[Point, Color]):
     encode_and_write(acc.build(), 'ghost/random')
 
 
-def do_ghost_eye_movement_logic(get_color: dict[Point, Color], ghost: int):
+def eye_paths(texture: 'ColorGrid') -> np.ndarray:
+    """
+    The next hop from every path position towards the ghost door at `EYE_ORIGIN`, as an array of [x, y] -> (x', y'), or
+    (-1, -1) if the position is not reachable (or is the origin). This is a single BFS from the origin, shared by every
+    ghost's path lookup, see `do_ghost_eye_movement_logic()`.
+    """
+    grid = texture.mask(*Color.path_colors())
+    next_hop = np.full((texture.width, texture.height, 2), -1, dtype=np.int64)
+    queue: deque[Point] = deque([EYE_ORIGIN])
+    visited = np.zeros_like(grid)
+    visited[EYE_ORIGIN] = True
+
+    while queue:
+        pos = x, y = queue.popleft()
+        for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            next = x + dx, y + dy
+            if texture.in_bounds(next) and grid[next] and not visited[next]:
+                next_hop[next] = pos
+                queue.append(next)
+                visited[next] = True
+    return next_hop
+
+
+def do_ghost_eye_movement_logic(next_hop: np.ndarray, ghost: int, backend: str = 'decider'):
     """
     When a ghost gets 'eaten', the same sprite is re-used to do the eye movement logic, as the ghost
     finds it's way back to the home area. It does this with a procedurally generated path-finding setup.
@@ -750,26 +1301,70 @@ def do_ghost_eye_movement_logic(get_color: dict[Point, Color], ghost: int):
 
     Ghost 0 and 1 are (0, 1), Ghost 2 is (-1, 0), and Ghost 3 is (1, 0)
     ```
+
+    The table is built with the given `backend`, see `write_position_lut()`, from the shared `next_hop` field of `eye_paths()`
     """
 
-    # In order to compute the eye movement lookup table, we need to BFS outwards from the 'return' point.
-    origin = (41, 34)
-    paths: dict[Point, Point] = dict()  # Mapping of (x, y) -> next (x, y)
-    queue: list[Point] = [origin]
-    visited: set[Point] = {origin}  # Visited positions
+    path_lookup = eye_path_lookup(next_hop, ghost)
+
+    # Build the lookup table
+    acc = Accounter('PathLookup[X, Y]')
+    path = Term('M')
+
+    for m in range(13):
+        acc.by_output[path == m] = Term3([])
+
+    write_position_lut('ghost/path_lookup_%d' % ghost, acc, path_lookup, 'M', backend)
+
+
+def do_ghost_eye_movement_shared_logic(next_hop: np.ndarray):
+    """
+    Builds a single path lookup for all ghosts, from (X, Y, I) -> M, where I is the ghost index. As the tables of each
+    ghost (see `eye_path_lookup()`) are identical except for the path into the ghost area, this consists of:
+    - A shared table, for every position where all ghosts have the same M
+    - A per-ghost table of overrides, for every other position, where each condition is gated by `I == ghost`
+
+    Overridden positions are excluded from the shared table, so at most one output fires. The lookup has the same latency
+    as each ghost's lookup, so it can be shared between ghosts by supplying each ghost's X, Y, I on a separate tick.
+    """
+    tables = [eye_path_lookup(next_hop, ghost) for ghost in range(4)]
+    shared = {pos: tables[0][pos] for pos in tables[0] if all(table.get(pos) == tables[0][pos] for table in tables)}
+
+    acc = Accounter('PathLookup[X, Y, I]')
+    path = Term('M')
+    index = Term('I', tuple(range(4)))
+
+    for m in range(13):
+        acc.by_output[path == m] = Term3([])
+
+    for m, positions in sorted(group_by_value(shared).items()):
+        acc.if_then(position_ranges(positions), path == m)
+
+    overrides = 0
+    for ghost, table in enumerate(tables):
+        delta = {pos: value for pos, value in table.items() if pos not in shared}
+        overrides += len(delta)
+        for m, positions in sorted(group_by_value(delta).items()):
+            acc.if_then(Term3([Term2([*product.and_values, index == ghost]) for product in position_ranges(positions).or_values]), path == m)
+
+    print('SHARED ghost/shared/path_lookup: %d shared positions, %d overrides, %d conditions' % (len(shared), overrides, acc.conditions()))
+    encode_and_write(acc.build(), 'ghost/shared/path_lookup')
+
+
+def group_by_value(table: dict[Point, int]) -> dict[int, set[Point]]:
+    """ The positions in `table`, grouped by their value """
+    by_value: dict[int, set[Point]] = defaultdict(set)
+    for pos, value in table.items():
+        by_value[value].add(pos)
+    return by_value
+
+
+def eye_path_lookup(next_hop: np.ndarray, ghost: int) -> dict[Point, int]:
+    """ The path lookup table (X, Y) -> M of `ghost`, see `do_ghost_eye_movement_logic()` """
+    # The paths outwards from the 'return' point, from a BFS shared between all ghosts, see `eye_paths()`
+    reachable = np.argwhere(next_hop[:, :, 0] >= 0).tolist()
+    paths: dict[Point, Point] = {(x, y): tuple(next_hop[x, y].tolist()) for x, y in reachable}  # Mapping of (x, y) -> next (x, y)
 
-    # BFS
-    while queue:
-        pos = x, y = queue.pop(0)
-        for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1)):
-            next = x + dx, y + dy
-            if next not in visited:
-                px = get_color(*next)
-                if Color.is_any_path_color(px):
-                    paths[next] = pos
-                    queue.append(next)
-                    visited.add(next)
-    
     # Also include paths from the origin, down into the ghost area (which are not noted in the texture)
     end = {
         0: (41, 41),
@@ -828,74 +1423,35 @@ def do_ghost_eye_movement_logic(get_color: dict[Point, Color], ghost: int):
                 path_lookup[pos] = 12
             case _:
                 assert False, 'Invalid path from %s -> %s -> %s' % (pos, (x1, y1), (x2, y2))
-    
-    # Build the lookup table
-    acc = Accounter('PathLookup[X, Y]')
-    path = Term('M')
-
-    for m in range(13):
-        acc.by_output[path == m] = Term3([])
-
-    for (x, y), m in path_lookup.items():
-        acc.if_then(
-            (Term('X') == x) & (Term('Y') == y),
-            path == m
-        )
-    
-    encode_and_write(acc.build(), 'ghost/path_lookup_%d' % ghost)
+    return path_lookup
 
 
-def load_textures():
+def load_palette(path: str = 'assets/texture.png') -> np.ndarray:
     """
-    Loads all textures and builds a series of `get_color(x: int, y: int) -> Color` functions from them
-
-    Returns a tuple of `get_color()` consisting of accessors for each of:
-    - `texture.png`
-    - `background.png`
-    - `text.png`
+    Loads the RGBA of each `Color`, by index, which are recorded in the top left of `path`. This lets colors be referred
+    to by constant, not RGB.
     """
-    os.makedirs('data', exist_ok=True)
-
-    texture: Image = Image.open('assets/texture.png').convert('RGBA')
-    background: Image = Image.open('assets/background.png').convert('RGBA')
-    text: Image = Image.open('assets/text.png').convert('RGBA')
-
-    # Color Mapping
-    # Map of colors to their index, so we can easily refer to colors by constant, not RGB
-    color_to_index: dict[ColorRGB, Color] = {}
-    for x in range(10):  # Number of recorded colors (top left)
-        color_to_index[texture.getpixel((x, 0))] = Color(len(color_to_index))
-    
-    def check(_texture: Image, _w: int = WIDTH, _h: int = HEIGHT):
-        assert _texture.size == (_w, _h), 'Expected size=(%d, %d), got=%s' % (_w, _h, _texture.size)
-        for _x in range(_w):
-            for _y in range(_h):
-                px = _texture.getpixel((_x, _y))
-                assert px in color_to_index or px == (0, 0, 0, 0), 'Expected known color at %d, %d, got %s' % (_x, _y, _texture.getpixel((_x, _y)))
+    return ColorGrid.load_rgba(path)[:len(Color), 0]
 
-    check(texture, _h=HEIGHT + 5)
-    check(background)
-    check(text, _w=32, _h=10)
 
-    def build(_texture: Image, _w: int = 0, _h: int = 0):
-        def get_color(_x: int, _y: int) -> int | None:
-            """ Return the grid color index at (x, y) """
-            px = _texture.getpixel((_x + _w, _y + _h))
-            return None if px == (0, 0, 0, 0) else color_to_index[px]
-        return get_color
+def load_texture(palette: np.ndarray, path: str, width: int, height: int, y_offset: int = 0) -> 'ColorGrid':
+    """
+    Loads a single texture, checking it's size and colors against `palette` (see `load_palette()`), and converts it into
+    a `ColorGrid`. The first `y_offset` rows are excluded from the returned grid.
+    """
+    texture = ColorGrid.load_rgba(path)
 
-    texture_get_color = build(texture, _h=5)
-    bg_get_color = build(background)
-    text_get_color = build(text)
+    assert texture.shape == (width, height), 'Expected size=(%d, %d), got=%s' % (width, height, texture.shape)
+    unknown = np.argwhere(~np.isin(texture, palette) & (texture != 0))
+    if unknown.size > 0:
+        x, y = unknown[0].tolist()
+        assert False, 'Expected known color at %d, %d, got %s' % (x, y, tuple(int(texture[x, y]).to_bytes(4, 'little')))
 
-    return texture_get_color, bg_get_color, text_get_color
+    return ColorGrid.from_rgba(texture[:, y_offset:], palette)
 
 
 def load_blueprint_single_combinator():
-    bp = decode_and_write(
-        '0eNp9j00KgzAQhe8y61QwNbZ6lVIk6tAO6ESSKBXJ3ZvoQrrpbv7e995s0A4zTpbYQ70BdYYd1I8NHL1YD2nGekSoIW28Zn/pzNgSa28sBAHEPX6gzsNTALInT3gA9mZteB5btPFA/AMJmIyLWsPJMfIu8pYpAWuqCpmp6NSTxe44uYtE8dYMTYtvvVBERJ079u63jlnOkCGkoORxjEnO1wUsaN3OVqWsiqpSSqryKvMQvoDOYqA=',
-        'rom'
-    )
+    bp = template('rom')
     bp['blueprint']['entities'][0]['control_behavior']['sections']['sections'][0]['filters'] = values = []
     return bp, values
     
@@ -907,19 +1463,79 @@ def load(path: str):
         return json.load(f)
 
 
-def decode_and_write(text: str, path: str) -> dict:
-    """ Decode a BP string and save the JSON to /data/<path>.json """
-    blueprint = decode_blueprint_string(text)
-    with open(f'data/{path}.json', 'w', encoding='utf-8') as f:
-        json.dump(blueprint, f, ensure_ascii=True, indent=4)
-    return blueprint
+def template(name: str) -> dict:
+    """ Returns a copy of the BP JSON of `TEMPLATES[name]`, which is only decoded once, on first use """
+    if name not in TEMPLATE_CACHE:
+        TEMPLATE_CACHE[name] = decode_blueprint_string(TEMPLATES[name])
+    return copy_json(TEMPLATE_CACHE[name])
+
+
+def copy_json(value):
+    """ A deep copy of a JSON value, which is much cheaper than `copy.deepcopy()` as it only handles dicts and lists """
+    if isinstance(value, dict):
+        return {k: copy_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_json(v) for v in value]
+    return value
+
+
+def dump_templates():
+    """ Saves the JSON of each template to /data/<name>.json, for inspection """
+    for name in TEMPLATES:
+        write_if_changed(f'data/{name}.json', json.dumps(template(name), ensure_ascii=True, indent=4))
 
 def encode_and_write(blueprint: dict, path: str):
     """ Encodes a BP JSON to a string an saves it to /data/<path>.txt """
     if '/' in path:
         os.makedirs('data/' + path[:path.rindex('/')], exist_ok=True)
-    text = encode_blueprint_string(blueprint)
-    with open(f'data/{path}.txt', 'w', encoding='utf-8') as f:
+    with trace_span(path, 'encode') as span:
+        text = encode_blueprint_string(blueprint)
+        write_if_changed(f'data/{path}.txt', text)
+        OUTPUTS.append(f'data/{path}.txt')
+        COSTS[f'data/{path}.txt'] = costs = blueprint_costs(blueprint, text)
+        span['bytes'] = len(text)
+    trace_count('conditions', costs['conditions'])
+    trace_count('bytes', len(text))
+
+
+def blueprint_costs(blueprint: dict, text: str) -> dict[str, int]:
+    """
+    Counts the costs of a blueprint. The number of conditions is the main proxy for it's UPS cost in game, as every
+    condition of every decider is evaluated each tick. Each decider has `1 + (number of 'or' conditions)` OR groups, where conditions are 'or' by default.
+    """
+    costs = {'deciders': 0, 'arithmetics': 0, 'constants': 0, 'conditions': 0, 'or_groups': 0, 'outputs': 0, 'bytes': len(text)}
+    signals = set()
+    for entity in blueprint['blueprint'].get('entities', ()):
+        behavior = entity.get('control_behavior', {})
+        if entity['name'] == 'decider-combinator':
+            conditions = behavior.get('decider_conditions', {}).get('conditions', [])
+            outputs = behavior.get('decider_conditions', {}).get('outputs', [])
+            costs['deciders'] += 1
+            costs['conditions'] += len(conditions)
+            costs['or_groups'] += 1 + sum(c.get('compare_type', 'or') == 'or' for c in conditions[1:])
+            costs['outputs'] += len(outputs)
+            signals |= {(c[k]['name'], c[k].get('quality')) for c in conditions for k in ('first_signal', 'second_signal') if k in c}
+            signals |= {(o['signal']['name'], o['signal'].get('quality')) for o in outputs if 'signal' in o}
+        elif entity['name'] == 'arithmetic-combinator':
+            arithmetic = behavior.get('arithmetic_conditions', {})
+            costs['arithmetics'] += 1
+            signals |= {(arithmetic[k]['name'], arithmetic[k].get('quality')) for k in ('first_signal', 'second_signal', 'output_signal') if k in arithmetic}
+        elif entity['name'] == 'constant-combinator':
+            filters = [f for section in behavior.get('sections', {}).get('sections', ()) for f in section.get('filters', ())]
+            costs['constants'] += 1
+            costs['outputs'] += len(filters)
+            signals |= {(f['name'], f.get('quality')) for f in filters}
+    costs['signals'] = len(signals)
+    return costs
+
+
+def write_if_changed(path: str, text: str):
+    """ Writes `text` to `path`, unless the file already has exactly that content, so unchanged outputs are not touched """
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == text:
+                return
+    with open(path, 'w', encoding='utf-8') as f:
         f.write(text)
 
 
@@ -933,90 +1549,452 @@ def decode_blueprint_string(blueprint: str) -> dict:
         raise ValueError('Unknown version byte %s' % version_char)
 
 
-def encode_blueprint_string(blueprint: dict, version_char: str = '0') -> str:
+def encode_blueprint_string(
+        blueprint: dict,
+        version_char: str = '0',
+        level: int | None = None,
+        strategy: int = zlib.Z_DEFAULT_STRATEGY
+    ) -> str:
+    """ Encodes a BP JSON to a BP string, with zlib `level` (by default, `BLUEPRINT_COMPRESSION_LEVEL`) and `strategy` """
     if version_char == '0':
-        text = json.dumps(blueprint)
-        compressed = zlib.compress(bytes(text, 'UTF-8'))
-        return '0' + base64.b64encode(compressed).decode('UTF-8')
+        return '0' + ''.join(iter_encode_blueprint(blueprint, BLUEPRINT_COMPRESSION_LEVEL if level is None else level, strategy))
     else:
         raise ValueError('Unknown version byte %s' % version_char)
 
 
-class Term(NamedTuple):
-    value: str | int | IntEnum
+def iter_encode_blueprint(blueprint: dict, level: int, strategy: int):
+    """
+    Encodes a BP JSON as chunks of base64, without the version byte. The compact JSON is streamed through zlib and base64,
+    so neither the full JSON text, nor the full compressed bytes, are ever held in memory.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS, 9, strategy)
+    pending = b''
+
+    def encode(data: bytes, final: bool = False) -> str:
+        nonlocal pending
+        pending += data
+        n = len(pending) if final else len(pending) - len(pending) % 3  # base64 encodes 3 bytes at a time, without padding
+        chunk, pending = pending[:n], pending[n:]
+        return base64.b64encode(chunk).decode('UTF-8')
+
+    buffer = []
+    for text in BLUEPRINT_ENCODER.iterencode(blueprint):
+        buffer.append(text)
+        if len(buffer) >= 1024:
+            yield encode(compressor.compress(''.join(buffer).encode('UTF-8')))
+            buffer.clear()
+    yield encode(compressor.compress(''.join(buffer).encode('UTF-8')) + compressor.flush(), True)
+
+
+class BuildCache:
+    """
+    A manifest, saved to /data/manifest.json, of a hash of the inputs to each stage of the build. A stage is only
+    ran if any of it's inputs have changed since the last build, or any of the outputs it wrote are missing.
+
+    The inputs to a stage are:
+    - The source of the generator, and all functions, classes and constants (in this module) it references
+    - The arguments passed to the generator, including texture regions
+    - The constants `WIDTH`, `HEIGHT`, `CONSTANTS` and `QUALITY`
+    """
+    path: str
+    force: bool
+    manifest: dict[str, dict]
+
+    def __init__(self, path: str, force: bool = False):
+        self.path = path
+        self.force = force
+        self.manifest = {}
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+    def is_up_to_date(self, name: str, key: str) -> bool:
+        """ Returns `true` if the stage `name` was last built with inputs hashing to `key`, and all it's outputs (and their costs) exist """
+        entry = self.manifest.get(name)
+        return not self.force and entry is not None and entry['hash'] == key and 'costs' in entry and all(os.path.isfile(p) for p in entry['outputs'])
+
+    def update(self, name: str, key: str, outputs: list[str], costs: dict[str, dict]):
+        self.manifest[name] = {'hash': key, 'outputs': outputs, 'costs': costs}
+
+    def costs(self) -> dict[str, dict]:
+        """ The costs of every output of every stage, see `blueprint_costs()` """
+        return {path: costs for entry in self.manifest.values() for path, costs in entry.get('costs', {}).items()}
+
+    def save(self):
+        write_if_changed(self.path, json.dumps(self.manifest, indent=4, sort_keys=True))
+
+    @staticmethod
+    def hash(generator, *args) -> str:
+        h = hashlib.sha256()
+        for source in BuildCache.sources(generator):
+            h.update(source.encode('utf-8'))
+        for arg in args:
+            BuildCache.hash_arg(h, arg)
+        h.update(repr((WIDTH, HEIGHT, CONSTANTS, QUALITY)).encode('utf-8'))
+        return h.hexdigest()
+
+    @staticmethod
+    def hash_arg(h, arg):
+        """ Updates `h` with `arg`, where callables (including those nested in tuples and lists) are hashed by source """
+        if isinstance(arg, ColorGrid):
+            arg = arg.array
+        if isinstance(arg, np.ndarray):
+            h.update(repr((arg.shape, arg.dtype.str)).encode('utf-8'))
+            h.update(arg.tobytes())
+        elif callable(arg):
+            h.update(''.join(BuildCache.sources(arg)).encode('utf-8'))
+        elif isinstance(arg, (tuple, list)):
+            h.update(('%s[%d]' % (type(arg).__name__, len(arg))).encode('utf-8'))
+            for value in arg:
+                BuildCache.hash_arg(h, value)
+        elif isinstance(arg, dict):
+            h.update(repr(sorted(arg.items())).encode('utf-8'))
+        else:
+            h.update(repr(arg).encode('utf-8'))
+
+    @staticmethod
+    def sources(generator) -> list[str]:
+        """ Returns the source of `generator`, and every function, class or constant in it's module it transitively references """
+        definitions = BuildCache.definitions(generator.__code__.co_filename)
+        sources: list[str] = [inspect.getsource(generator)]
+        seen: set[str] = set()
+        queue: list[str] = []
+
+        # Collect all names referenced by the generator, including by nested functions and lambdas
+        codes = [generator.__code__]
+        while codes:
+            code = codes.pop()
+            codes += [c for c in code.co_consts if inspect.iscode(c)]
+            queue += code.co_names
+        
+        while queue:
+            name = queue.pop()
+            if name in definitions and name not in seen:
+                seen.add(name)
+                source, names = definitions[name]
+                sources.append(source)
+                queue += names
+        return sorted(sources)
+
+    @staticmethod
+    def definitions(filename: str) -> dict[str, tuple[str, set[str]]]:
+        """
+        Returns a map of every top level function, class or constant in `filename`, to it's source and the names it
+        references. Constants are included so that changing i.e. `BANK_WIDTH` invalidates every stage which uses it.
+        """
+        if filename not in BUILD_DEFINITIONS:
+            with open(filename, 'r', encoding='utf-8') as f:
+                text = f.read()
+            lines = text.splitlines(keepends=True)
+            definitions = BUILD_DEFINITIONS[filename] = {}
+            for node in ast.parse(text).body:
+                if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                    targets = [node.name]
+                elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                    targets = [n.id for t in (node.targets if isinstance(node, ast.Assign) else [node.target]) for n in ast.walk(t) if isinstance(n, ast.Name)]
+                else:
+                    continue
+                source = ''.join(lines[node.lineno - 1:node.end_lineno])
+                names = {n.id for n in ast.walk(node) if isinstance(n, ast.Name)} - set(targets)
+                for target in targets:
+                    definitions[target] = (source, names)
+        return BUILD_DEFINITIONS[filename]
+
+
+class Stage(NamedTuple):
+    """
+    A single stage of the build, which runs `generator(*requires, *args)`, where `requires` are the results of other stages.
+    - `cache = True`  : The stage is an artifact, which is skipped if it is up to date
+    - `cache = False` : The stage is always ran, and it's result is passed to stages which require it
+    """
+    name: str
+    generator: Callable
+    args: tuple = ()
+    requires: tuple[str, ...] = ()
+    cache: bool = True
+
+
+class ColorGrid:
+    """
+    A texture, converted once into an array of `Color` indices, indexed by `array[x, y]`.
+    Empty (transparent) pixels are stored as `ColorGrid.NONE`.
+    """
+    NONE = 0xFF
+
+    array: np.ndarray
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+
+    @property
+    def width(self) -> int: return self.array.shape[0]
+
+    @property
+    def height(self) -> int: return self.array.shape[1]
+
+    def in_bounds(self, pos: Point) -> bool:
+        x, y = pos
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def mask(self, *colors: Color) -> np.ndarray:
+        """ Returns a boolean array, `true` where the pixel is any of `colors` """
+        return np.isin(self.array, colors)
+
+    def where(self, mask: np.ndarray, color: Color | None = None) -> 'ColorGrid':
+        """ Returns a new grid with only the pixels in `mask`, optionally recolored to `color` """
+        return ColorGrid(np.where(mask, self.array if color is None else color, ColorGrid.NONE).astype(np.uint8))
 
-    def __eq__(self, value): return Term1(self.value, '=', value)
-    def __ne__(self, value): return Term1(self.value, '\u2260', value)
+    @staticmethod
+    def load_rgba(path: str) -> np.ndarray:
+        """ Loads an image as an array of packed RGBA pixels, indexed by `[x, y]` """
+        image = np.asarray(Image.open(path).convert('RGBA'), dtype=np.uint8)
+        return image.view('<u4')[..., 0].T
+
+    @staticmethod
+    def from_rgba(texture: np.ndarray, palette: np.ndarray) -> 'ColorGrid':
+        """ Converts packed RGBA pixels to color indices, where the color index is the position in `palette` """
+        array = np.full(texture.shape, ColorGrid.NONE, dtype=np.uint8)
+        for color in reversed(Color):  # Reversed, so that the first index of a duplicate color is used
+            array[texture == palette[color]] = color
+        return ColorGrid(array)
+
+
+class Term:
+    """
+    A signal, optionally with the domain of values it can take. Comparing a `Term` produces a `Term1`, so terms are
+    interned by their signal instead, and hash by identity. The domain is metadata of the signal, so `Term('D')` is the
+    same term as `Term('D', domain)`, and a signal can only be declared with one domain. Interned terms are cleared
+    after each stage of the build, see `clear_terms()`.
+    """
+    __slots__ = ('value', 'domain', '__weakref__')
+    _interned: dict[tuple, 'Term'] = {}
+
+    value: str | int | IntEnum
+    domain: tuple[int, ...] | None  # All values this signal can take, if known
+
+    def __new__(cls, value: str | int | IntEnum, domain: tuple[int, ...] | None = None):
+        key = (type(value), value)
+        if (term := cls._interned.get(key)) is None:
+            trace_count('Term')
+            term = cls._interned[key] = object.__new__(cls)
+            term.value = value
+            term.domain = domain
+        elif domain is not None and domain != term.domain:
+            if term.domain is not None:
+                raise ValueError('Signal %s has domain %s, so it can\'t also have domain %s' % (value, term.domain, domain))
+            term.domain = domain
+        return term
+
+    def __getnewargs__(self): return self.value, self.domain
+    def __hash__(self): return id(self)
+
+    def __eq__(self, value): return Term1(self, '=', value)
+    def __ne__(self, value): return Term1(self, '\u2260', value)
+    def __lt__(self, value): return Term1(self, '<', value)
+    def __le__(self, value): return Term1(self, '\u2264', value)
+    def __gt__(self, value): return Term1(self, '>', value)
+    def __ge__(self, value): return Term1(self, '\u2265', value)
     
     def __repr__(self): return str(self.value)
 
 
-class Term1(NamedTuple):
+class Term1:
+    """ A single comparison `lhs op rhs`. These are interned, so equal comparisons are the same object, and safe as dict keys """
+    __slots__ = ('lhs', 'op', 'rhs')
+    _interned: dict[tuple, 'Term1'] = {}
+
     lhs: Term
     op: str
-    rhs: Term
+    rhs: Any
+
+    def __new__(cls, lhs: Term, op: str, rhs):
+        key = (lhs, op, type(rhs), rhs)
+        if (term := cls._interned.get(key)) is None:
+            trace_count('Term1')
+            term = cls._interned[key] = object.__new__(cls)
+            term.lhs = lhs
+            term.op = op
+            term.rhs = rhs
+        return term
+
+    def __getnewargs__(self): return self.lhs, self.op, self.rhs
 
     def __and__(self, value) -> 'Term2':
         if isinstance(value, Term1):
             return Term2([self, value])
         if isinstance(value, Term2):
-            return Term2([self] + value.and_values)
+            return Term2([self, *value.and_values])
         raise ValueError('%s and %s' % (repr(self), repr(value)))
     
     def __or__(self, value) -> 'Term3':
-        if isinstance(value, Term1):
-            return Term3([Term2([self]), Term2([value])])
-        if isinstance(value, Term2):
-            return Term3([Term2([self]), value])
-        if isinstance(value, Term3):
-            return Term3([Term2([self])] + value.or_values)
-        raise ValueError('%s or %s' % (repr(self), repr(value)))
+        return Term3([Term2([self])]) | value
 
     def __repr__(self):
         return '%s %s %s' % (self.lhs, self.op, self.rhs)
 
 
-class Term2(NamedTuple):
-    and_values: list[Term1]
+class Term2:
+    """ A product (and) of comparisons. Products are short, so these are treated as immutable """
+    __slots__ = ('and_values',)
+
+    def __init__(self, and_values: list[Term1]):
+        trace_count('Term2')
+        self.and_values = and_values
 
     def __and__(self, value) -> 'Term2':
         if isinstance(value, Term1):
-            return Term2(self.and_values + [value])
+            return Term2([*self.and_values, value])
         if isinstance(value, Term2):
-            return Term2(self.and_values + value.and_values)
+            return Term2([*self.and_values, *value.and_values])
         raise ValueError('%s and %s' % (repr(self), repr(value)))
     
     def __or__(self, value) -> 'Term3':
-        if isinstance(value, Term1):
-            return Term3([self, Term2([value])])
-        if isinstance(value, Term2):
-            return Term3([self, value])
-        if isinstance(value, Term3):
-            return Term3([self] + value.or_values)
-        raise ValueError('%s or %s' % (repr(self), repr(value)))
+        return Term3([self]) | value
     
     def __repr__(self):
         return '(%s)' % ' and '.join(map(str, self.and_values))
 
-class Term3(NamedTuple):
-    or_values: list[Term2]
+class Term3:
+    """ A sum (or) of products. `|=` appends in place, so accumulating N products is linear, whereas `|` copies """
+    __slots__ = ('or_values',)
+
+    def __init__(self, or_values: list[Term2]):
+        trace_count('Term3')
+        self.or_values = or_values
 
     def __and__(self, value): raise ValueError('%s and %s' % (repr(self), repr(value)))
     def __or__(self, value) -> 'Term3':
+        return Term3(list(self.or_values)).__ior__(value)
+    
+    def __ior__(self, value) -> 'Term3':
         if isinstance(value, Term1):
-            return Term3(self.or_values + [Term2([value])])
-        if isinstance(value, Term2):
-            return Term3(self.or_values + [value])
-        if isinstance(value, Term3):
-            return Term3(self.or_values + value.or_values)
-        raise ValueError('%s or %s' % (repr(self), repr(value)))
+            self.or_values.append(Term2([value]))
+        elif isinstance(value, Term2):
+            self.or_values.append(value)
+        elif isinstance(value, Term3):
+            self.or_values.extend(value.or_values)
+        else:
+            raise ValueError('%s or %s' % (repr(self), repr(value)))
+        return self
 
     def __repr__(self):
         return ' or '.join(map(str, self.or_values))
 
+def clear_terms():
+    """ Clears the interned `Term` and `Term1` objects, so they don't accumulate across stages of the build """
+    Term._interned.clear()
+    Term1._interned.clear()
+
+
+def minimize(term: Term3) -> Term3:
+    """
+    Minimizes a sum-of-products `term`, over the finite domains of each signal it uses. This is a heuristic two-level minimizer
+    in the style of Espresso, over multi-valued inputs: each product is expanded as far as possible while staying within the
+    original function, and then redundant products are removed.
+
+    Signals with a declared `domain` are assumed to only take those values, so any other inputs are considered don't-cares.
+    Otherwise the domain is every constant the signal is compared with, plus a single value representing "any other".
+    If the minimized term is not smaller, the domain is too large, or it uses comparisons other than `=` and `\u2260`,
+    the original term is returned.
+    """
+    OTHER = None
+
+    if any(and_value.op not in ('=', '\u2260') for or_value in term.or_values for and_value in or_value.and_values):
+        return term
+
+    signals: dict[str, Term] = {}
+    for or_value in term.or_values:
+        for and_value in or_value.and_values:
+            signals.setdefault(str(and_value.lhs), and_value.lhs)
+    
+    names = list(signals)
+    domains: list[list] = []
+    for name, signal in signals.items():
+        constants = {and_value.rhs for or_value in term.or_values for and_value in or_value.and_values if str(and_value.lhs) == name}
+        if signal.domain is not None:
+            domains.append(sorted(set(signal.domain) | constants))
+        else:
+            domains.append(sorted(constants) + [OTHER])
+    
+    if not term.or_values or math.prod(map(len, domains)) > MINIMIZE_LIMIT:
+        return term
+    
+    def literal(i: int, op: str, rhs) -> set[int]:
+        k = domains[i].index(rhs)
+        return {k} if op == '=' else set(range(len(domains[i]))) - {k}
+
+    def cost(i: int, values: tuple[int, ...]) -> float:
+        if len(values) == len(domains[i]):
+            return 0
+        if len(values) == 1 and domains[i][values[0]] is not OTHER:
+            return 1
+        excluded = set(range(len(domains[i]))) - set(values)
+        if all(domains[i][j] is not OTHER for j in excluded):
+            return len(excluded)
+        return math.inf  # Not expressible as a single product
+    
+    # Convert each product into a cube, of the allowed values for each signal
+    cubes: list[tuple[tuple[int, ...], ...]] = []
+    for or_value in term.or_values:
+        cube = [tuple(range(len(domain))) for domain in domains]
+        for and_value in or_value.and_values:
+            i = names.index(str(and_value.lhs))
+            allowed = literal(i, and_value.op, and_value.rhs)
+            cube[i] = tuple(j for j in cube[i] if j in allowed)
+        if all(cube):
+            cubes.append(tuple(cube))
+    
+    # The set of all inputs for which `term` is true
+    on = np.zeros([len(domain) for domain in domains], dtype=bool)
+    for cube in cubes:
+        on[np.ix_(*cube)] = True
+
+    # Expand each cube, widening each signal as far as possible while the cube only covers inputs in `on`
+    expanded = []
+    for cube in sorted(cubes, key=lambda c: -math.prod(map(len, c))):
+        cube = list(cube)
+        for i in range(len(cube)):
+            # All values of this signal which, combined with the rest of the cube, are within `on`
+            within = on[np.ix_(*cube[:i], range(len(domains[i])), *cube[i + 1:])]
+            candidate = tuple(np.flatnonzero(within.all(axis=tuple(a for a in range(on.ndim) if a != i))).tolist())
+            if cost(i, candidate) <= cost(i, cube[i]):
+                cube[i] = candidate
+        cube = tuple(cube)
+        if cube not in expanded:
+            expanded.append(cube)
+    
+    # Remove redundant cubes, smallest first, where every input they cover is covered by another cube
+    count = np.zeros(on.shape, dtype=int)
+    for cube in expanded:
+        count[np.ix_(*cube)] += 1
+    for cube in sorted(expanded, key=lambda c: math.prod(map(len, c))):
+        if (count[np.ix_(*cube)] > 1).all():
+            count[np.ix_(*cube)] -= 1
+            expanded.remove(cube)
+    
+    if sum(cost(i, values) for cube in expanded for i, values in enumerate(cube)) >= sum(len(or_value.and_values) for or_value in term.or_values):
+        return term
+    
+    # Convert back to a sum-of-products
+    result = Term3([])
+    for cube in expanded:
+        and_values = []
+        for i, values in enumerate(cube):
+            if len(values) == len(domains[i]):
+                continue
+            if len(values) == 1 and domains[i][values[0]] is not OTHER:
+                and_values.append(signals[names[i]] == domains[i][values[0]])
+            else:
+                and_values += [signals[names[i]] != domains[i][j] for j in range(len(domains[i])) if j not in values]
+        if not and_values:
+            return term  # Always true, which cannot be expressed as a condition
+        result.or_values.append(Term2(and_values))
+    return result
+
+
 class Accounter:
     text: str
-    by_output: dict[str | int | Term | Term1, Term3]
+    by_output: dict[str | int | Term | Term1 | tuple, Term3]
 
     def __init__(self, text: str = ''):
         self.by_output = defaultdict(lambda: Term3([]))
@@ -1025,109 +2003,360 @@ class Accounter:
     def if_then(self, term: Term3 | Term2 | Term1, output: str | int | Term1 | Term | tuple):
         self.by_output[output] |= term
     
+    def conditions(self) -> int:
+        """ The total number of conditions, across all outputs """
+        return sum(len(or_value.and_values) for term in self.by_output.values() for or_value in term.or_values)
+
+    def minimize(self):
+        """ Minimizes the conditions for each output. See `minimize()` """
+        for output, term in self.by_output.items():
+            self.by_output[output] = minimize(term)
+    
     def __repr__(self): return 'Accounter[\n%s\n]' % '\n'.join('  if %s\n    then %s' % (v, k) for k, v in self.by_output.items())
     def __str__(self): return repr(self)
 
     def build(self) -> dict:
         """
-        Builds a BP JSON for a sequence of combinators representing this LUT
+        Builds a BP JSON for a sequence of combinators representing this LUT, after minimizing the conditions for each output
         """
-        bp = decode_and_write(
-            '0eNqlk1FOwzAMhq+C/JwhbbRTV4kXJO4AQlOVNd6IaJOQpGPVlANwC87GSXDasY0xARuPcez//+zEa5hVDRorlYd8DbLUykH+sAYnF4pXMaZ4jZCDwFIKtINS1zOpuNcWAgOpBK4gH4YpA1Reeol9fXdoC9XUM7SUwH7QYWC0o1Ktoh/JZdllyqCFfDBKMnIR0mLZ32cMiNFbXRUzfORLSfVUtFEt6E50Si5G90/ENJfW+WLXmW9NJFpK6xuKbBH7jMFdbDAOxPM4nWE81IbbjjmHayrYVywU+hdtnzpniwJybxtksLCIBD7nlcMQ2MkY918xRidjdM5bjggVPjWw2JhzJeAMtoMRXX1jO6tfBs90Qd+Hgo0ixZpe/otRcmD0/vp24hj65zg+B/rLuvGm8Yer8Av5TYT86y/4p+qRRw1TEgZT8ZYWQaArrTT90sDtitemwguPK9/1Jz3WFN8tP4MlWtdlp+PRJJlM0jQdZsk4CeEDtbpwGA==',
-            'lut'
-        )
+        with trace_span(self.text or 'Accounter', 'build') as span:
+            span['conditions'] = self.conditions()
+            self.minimize()
+            bp = template('lut')
+
+            bp['blueprint']['entities'] = entities = []
+            sources: dict[tuple[Term, Term], list[int]] = defaultdict(list)
+            for i, (out, term) in enumerate(self.by_output.items()):
+                entity = self.decider(i + 1, out, term, i + 0.5, 0)
+                if entity is not None:
+                    entities.append(entity)
+                    if type(out) == tuple and len(out) == 3:
+                        sources[out[0], out[2]].append(entity['entity_number'])
+            if sources:
+                self.wire_sources(bp, sources)
+            span['minimized'] = self.conditions()
+        return bp
 
-        bp['blueprint']['entities'] = entities = []
-        for i, (out, term) in enumerate(self.by_output.items()):
+    def wire_sources(self, bp: dict, sources: dict[tuple[Term, Term], list[int]]):
+        """
+        For outputs `(output, comment, source)`, where each case passes the value of the signal `source` through to `output`,
+        by copying `output` from it's green input. Adds an arithmetic combinator for each source, which renames it (read
+        from the red input) to `output`, and wires it to the green inputs of those cases. This adds one tick of latency.
+        """
+        entities = bp['blueprint']['entities']
+        bp['blueprint']['wires'] = wires = []
+        number = max(entity['entity_number'] for entity in entities)
+        for i, ((out, source), cases) in enumerate(sources.items()):
+            number += 1
+            entities.append({
+                'entity_number': number,
+                'name': 'arithmetic-combinator',
+                'position': {
+                    'x': i + 0.5,
+                    'y': 2
+                },
+                'direction': 8,
+                'control_behavior': {
+                    'arithmetic_conditions': {
+                        'first_signal': Accounter.signal(source),
+                        'first_signal_networks': {
+                            'red': True,
+                            'green': False
+                        },
+                        'operation': '+',
+                        'second_constant': 0,
+                        'output_signal': Accounter.signal(out)
+                    }
+                },
+                'player_description': '%s%s <= %s' % (self.text + ': ' if self.text else '', out, source)
+            })
+            for prev, case in zip([number] + cases, cases):
+                wires.append([prev, 4 if prev == number else 2, case, 2])
 
-            comment = self.text
-            if type(out) == tuple:
-                out, c = out
-                comment += ', ' + c
-            
-            if comment != '':
-                comment += ': '
+    @staticmethod
+    def signal(term: Term) -> dict:
+        """ The virtual signal of `term`, where a second character is the quality, i.e. 'D2' -> (signal-D, uncommon) """
+        name = str(term)
+        return {
+            'type': 'virtual',
+            'name': 'signal-%s' % name[0],
+            'quality': QUALITY[0 if len(name) == 1 else int(name[1]) - 1]
+        }
+
+    def build_banked(self, width: int, signal: str = 'X') -> dict:
+        """
+        Builds a BP JSON for this LUT, where the conditions for each output are partitioned into banks, each covering `width`
+        values of `signal`, and only needing conditions for positions within the bank.
 
-            comment += 'Output %s' % str(out)
-            
-            if isinstance(out, Term1) and isinstance(out.rhs, IntEnum):
-                comment += ' (%d)' % out.rhs.value
+        Each bank is a row of combinators, gated by a selector which only passes the (red) input through to the bank when
+        `signal` is within the bank. This adds one tick of latency over `build()`. All selectors share a single (red) input,
+        and all banks share a single (green) output.
+        """
+        self.minimize()
+        bp = template('lut')
+        key = Term(signal)
+
+        # Partition each product into the bank(s) it's range of `signal` overlaps
+        banks: dict[int, dict[Any, Term3]] = defaultdict(lambda: {out: Term3([]) for out in self.by_output})
+        for out, term in self.by_output.items():
+            for or_value in term.or_values:
+                lo, hi = -math.inf, math.inf
+                for and_value in or_value.and_values:
+                    if str(and_value.lhs) == signal:
+                        match and_value.op:
+                            case '=': lo, hi = max(lo, and_value.rhs), min(hi, and_value.rhs)
+                            case '>': lo = max(lo, and_value.rhs + 1)
+                            case '\u2265': lo = max(lo, and_value.rhs)
+                            case '<': hi = min(hi, and_value.rhs - 1)
+                            case '\u2264': hi = min(hi, and_value.rhs)
+                assert lo != -math.inf and hi != math.inf, 'Banked LUT requires every condition to bound %s, got %s' % (signal, or_value)
+
+                for bank in range(lo // width, hi // width + 1):
+                    bank_lo, bank_hi = bank * width, bank * width + width - 1
+
+                    # Conditions on `signal` which are implied by the bank's selector are not needed
+                    def implied(and_value: Term1) -> bool:
+                        if str(and_value.lhs) != signal:
+                            return False
+                        match and_value.op:
+                            case '=': return bank_lo == bank_hi == and_value.rhs
+                            case '>': return and_value.rhs < bank_lo
+                            case '\u2265': return and_value.rhs <= bank_lo
+                            case '<': return and_value.rhs > bank_hi
+                            case '\u2264': return and_value.rhs >= bank_hi
+                        return False
+                    
+                    and_values = [and_value for and_value in or_value.and_values if not implied(and_value)] or [key >= bank_lo]
+                    banks[bank][out].or_values.append(Term2(and_values))
+        
+        bp['blueprint']['entities'] = entities = []
+        bp['blueprint']['wires'] = wires = []
+        prev_selector = prev_first = None
+        for row, bank in enumerate(sorted(banks)):
+            bank_lo, bank_hi = bank * width, bank * width + width - 1
 
+            # Selector, which passes through all inputs when `signal` is within this bank
+            selector = len(entities) + 1
             entities.append({
-                'entity_number': i + 1,
+                'entity_number': selector,
                 'name': 'decider-combinator',
                 'position': {
-                    'x': i + 0.5,
-                    'y': 0
+                    'x': 0.5,
+                    'y': 2 * row
                 },
                 'direction': 8,
                 'control_behavior': {
                     'decider_conditions': {
-                        'conditions': (conditions := []),
-                        'outputs': (outputs := [])
+                        'conditions': [],
+                        'outputs': [{
+                            'signal': {
+                                'type': 'virtual',
+                                'name': 'signal-everything'
+                            },
+                            'networks': {
+                                'red': True,
+                                'green': False
+                            }
+                        }]
                     }
                 },
-                'player_description': comment
+                'player_description': '%sBank %s in [%d, %d]' % (self.text + ': ' if self.text else '', signal, bank_lo, bank_hi)
             })
-
-            if isinstance(out, Term):
-                out = out == 'value'
-            if isinstance(out, Term1):
-                assert out.op == '='
-                if out.rhs == 0:  # Output 0, so exclude it completely!
-                    entities.pop(-1)
+            self.conditions_of(entities[-1], (key >= bank_lo) & (key <= bank_hi))
+            if prev_selector is not None:
+                wires.append([prev_selector, 1, selector, 1])
+            prev_selector = selector
+
+            # Bank, with the red input from the selector, and green output shared with all other banks
+            prev = first = None
+            for out, term in banks[bank].items():
+                if not term.or_values:
+                    continue
+                entity = self.decider(len(entities) + 1, out, term, len(entities) - selector + 1.5, 2 * row)
+                if entity is None:
                     continue
+                entities.append(entity)
+                number = entity['entity_number']
+                wires.append([selector, 3, number, 1] if prev is None else [prev, 1, number, 1])
+                if prev is not None:
+                    wires.append([prev, 4, number, 4])
+                if first is None:
+                    first = number
+                prev = number
+            
+            if first is not None:
+                if prev_first is not None:
+                    wires.append([prev_first, 4, first, 4])
+                prev_first = first
+        return bp
+    
+    @staticmethod
+    def bank_conditions(bp: dict) -> tuple[int, int]:
+        """ For a blueprint built with `build_banked()`, returns the number of banks, and the most conditions in any bank """
+        rows: dict[float, int] = defaultdict(int)
+        for entity in bp['blueprint']['entities']:
+            rows[entity['position']['y']] += len(entity['control_behavior']['decider_conditions']['conditions'])
+        return len(rows), max(rows.values())
+
+    def decider(self, entity_number: int, out, term: Term3, x: float, y: float) -> dict | None:
+        """
+        Builds a single decider combinator, which emits `out` when `term` is true, or `None` if the output is always zero
+        """
+        comment = self.text
+        if type(out) == tuple:
+            out, c = out[:2]
+            comment += ', ' + c
+        
+        if comment != '':
+            comment += ': '
 
-                lhs = str(out.lhs)
-                if out.rhs == 'value':
-                    outputs.append({
-                        'signal': {
-                            'type': 'virtual',
-                            'name': 'signal-%s' % lhs[0],
-                            'quality': QUALITY[0 if len(lhs) == 1 else int(lhs[1]) - 1]
-                        },
-                        'networks': {
-                            'red': False,
-                            'green': True
-                        }
-                    })
-                else:
-                    outputs += [{
-                        'signal': {
-                            'type': 'virtual',
-                            'name': 'signal-%s' % lhs[0],
-                            'quality': QUALITY[0 if len(lhs) == 1 else int(lhs[1]) - 1]
-                        },
-                        'copy_count_from_input': False
-                    }] * out.rhs
+        comment += 'Output %s' % str(out)
+        
+        if isinstance(out, Term1) and isinstance(out.rhs, IntEnum):
+            comment += ' (%d)' % out.rhs.value
+
+        entity = {
+            'entity_number': entity_number,
+            'name': 'decider-combinator',
+            'position': {
+                'x': x,
+                'y': y
+            },
+            'direction': 8,
+            'control_behavior': {
+                'decider_conditions': {
+                    'conditions': [],
+                    'outputs': (outputs := [])
+                }
+            },
+            'player_description': comment
+        }
+
+        if isinstance(out, Term):
+            out = out == 'value'
+        if isinstance(out, Term1):
+            assert out.op == '='
+            if out.rhs == 0:  # Output 0, so exclude it completely!
+                return None
+
+            lhs = str(out.lhs)
+            if out.rhs == 'value':
+                outputs.append({
+                    'signal': {
+                        'type': 'virtual',
+                        'name': 'signal-%s' % lhs[0],
+                        'quality': QUALITY[0 if len(lhs) == 1 else int(lhs[1]) - 1]
+                    },
+                    'networks': {
+                        'red': False,
+                        'green': True
+                    }
+                })
             else:
-                outputs.append({})
+                # A single output of the constant value, so the size is independent of the value (and negative values work)
+                outputs.append({
+                    'signal': {
+                        'type': 'virtual',
+                        'name': 'signal-%s' % lhs[0],
+                        'quality': QUALITY[0 if len(lhs) == 1 else int(lhs[1]) - 1]
+                    },
+                    'copy_count_from_input': False
+                })
+                if out.rhs != 1:
+                    outputs[-1]['constant'] = int(out.rhs)
+        else:
+            outputs.append({})
 
-            for or_value in term.or_values:
-                for j, and_value in enumerate(or_value.and_values):
-                    lhs = str(and_value.lhs)
-                    conditions.append({
-                        'first_signal': {
-                            'type': 'virtual',
-                            'name': 'signal-%s' % lhs[0],
-                            'quality': QUALITY[0 if len(lhs) == 1 else int(lhs[1]) - 1]
-                        },
-                        'first_signal_networks': {
-                            'red': True,
-                            'green': False
-                        },
-                        'comparator': and_value.op,
-                        'constant': and_value.rhs
-                    })
-                    if j != 0:
-                        conditions[-1]['compare_type'] = 'and'
-        return bp
+        self.conditions_of(entity, term)
+        return entity
+
+    @staticmethod
+    def conditions_of(entity: dict, term: 'Term3 | Term2 | Term1'):
+        """ Appends the conditions of `term`, read from the red network, to the decider combinator `entity` """
+        if isinstance(term, Term1):
+            term = Term2([term])
+        if isinstance(term, Term2):
+            term = Term3([term])
+        
+        conditions = entity['control_behavior']['decider_conditions']['conditions']
+        for or_value in term.or_values:
+            for j, and_value in enumerate(or_value.and_values):
+                lhs = str(and_value.lhs)
+                conditions.append({
+                    'first_signal': {
+                        'type': 'virtual',
+                        'name': 'signal-%s' % lhs[0],
+                        'quality': QUALITY[0 if len(lhs) == 1 else int(lhs[1]) - 1]
+                    },
+                    'first_signal_networks': {
+                        'red': True,
+                        'green': False
+                    },
+                    'comparator': and_value.op,
+                    'constant': and_value.rhs
+                })
+                if j != 0:
+                    conditions[-1]['compare_type'] = 'and'
 
 
 # Factorio Constants
 CONSTANTS = ['wooden-chest', 'iron-chest', 'steel-chest', 'storage-tank', 'transport-belt', 'fast-transport-belt', 'express-transport-belt', 'turbo-transport-belt', 'underground-belt', 'fast-underground-belt', 'express-underground-belt', 'turbo-underground-belt', 'splitter', 'fast-splitter', 'express-splitter', 'turbo-splitter', 'burner-inserter', 'inserter', 'long-handed-inserter', 'fast-inserter', 'bulk-inserter', 'stack-inserter', 'small-electric-pole', 'medium-electric-pole', 'big-electric-pole', 'substation', 'pipe', 'pipe-to-ground', 'pump', 'rail', 'rail-ramp', 'rail-support', 'train-stop', 'rail-signal', 'rail-chain-signal', 'locomotive', 'cargo-wagon', 'fluid-wagon', 'artillery-wagon', 'car', 'tank', 'spidertron', 'logistic-robot', 'construction-robot', 'active-provider-chest', 'passive-provider-chest', 'storage-chest', 'buffer-chest', 'requester-chest', 'roboport', 'small-lamp', 'arithmetic-combinator', 'decider-combinator', 'selector-combinator', 'constant-combinator', 'power-switch', 'programmable-speaker', 'display-panel', 'stone-brick', 'concrete', 'hazard-concrete', 'refined-concrete', 'refined-hazard-concrete', 'landfill', 'artificial-yumako-soil', 'overgrowth-yumako-soil', 'artificial-jellynut-soil', 'overgrowth-jellynut-soil', 'ice-platform', 'foundation', 'cliff-explosives', 'repair-pack', 'blueprint', 'deconstruction-planner', 'upgrade-planner', 'blueprint-book', 'boiler', 'steam-engine', 'solar-panel', 'accumulator', 'nuclear-reactor', 'heat-pipe', 'heat-exchanger', 'steam-turbine', 'fusion-reactor', 'fusion-generator', 'burner-mining-drill', 'electric-mining-drill', 'big-mining-drill', 'offshore-pump', 'pumpjack', 'stone-furnace', 'steel-furnace', 'electric-furnace', 'foundry', 'recycler', 'agricultural-tower', 'biochamber', 'captive-biter-spawner']
 QUALITY = ['normal', 'uncommon', 'rare', 'epic', 'legendary']
 
+# All /data/*.txt files written by the current build, in order
+OUTPUTS: list[str] = []
+
+# Costs of each output written by the current build, see `blueprint_costs()`
+COSTS: dict[str, dict] = {}
+
+# Trace events and counters, or `None` if tracing is not enabled, see `enable_tracing()`
+TRACE_ENV = 'PACMAN_TRACE'
+TRACE_EVENTS: list[dict] | None = None
+TRACE_COUNTERS: dict[str, int] | None = None
+
+# The ghost door, from which the eye paths BFS starts, see `eye_paths()`
+EYE_ORIGIN = (41, 34)
+
+# Cache of top level definitions, by filename, used by `BuildCache`
+BUILD_DEFINITIONS: dict[str, dict[str, tuple[str, set[str]]]] = {}
+
+# zlib level used to compress blueprint strings, see `encode_blueprint_string()`
+BLUEPRINT_COMPRESSION_LEVEL = 9
+
+# Compact JSON encoder for blueprint strings, as whitespace is just more bytes to compress
+BLUEPRINT_ENCODER = json.JSONEncoder(separators=(',', ':'))
+
+# Blueprint templates, see `template()`
+# A single decider combinator
+LUT_BLUEPRINT = '0eNqlk1FOwzAMhq+C/JwhbbRTV4kXJO4AQlOVNd6IaJOQpGPVlANwC87GSXDasY0xARuPcez//+zEa5hVDRorlYd8DbLUykH+sAYnF4pXMaZ4jZCDwFIKtINS1zOpuNcWAgOpBK4gH4YpA1Reeol9fXdoC9XUM7SUwH7QYWC0o1Ktoh/JZdllyqCFfDBKMnIR0mLZ32cMiNFbXRUzfORLSfVUtFEt6E50Si5G90/ENJfW+WLXmW9NJFpK6xuKbBH7jMFdbDAOxPM4nWE81IbbjjmHayrYVywU+hdtnzpniwJybxtksLCIBD7nlcMQ2MkY918xRidjdM5bjggVPjWw2JhzJeAMtoMRXX1jO6tfBs90Qd+Hgo0ixZpe/otRcmD0/vp24hj65zg+B/rLuvGm8Yer8Av5TYT86y/4p+qRRw1TEgZT8ZYWQaArrTT90sDtitemwguPK9/1Jz3WFN8tP4MlWtdlp+PRJJlM0jQdZsk4CeEDtbpwGA=='
+
+# A single constant combinator
+ROM_BLUEPRINT = '0eNp9j00KgzAQhe8y61QwNbZ6lVIk6tAO6ESSKBXJ3ZvoQrrpbv7e995s0A4zTpbYQ70BdYYd1I8NHL1YD2nGekSoIW28Zn/pzNgSa28sBAHEPX6gzsNTALInT3gA9mZteB5btPFA/AMJmIyLWsPJMfIu8pYpAWuqCpmp6NSTxe44uYtE8dYMTYtvvVBERJ079u63jlnOkCGkoORxjEnO1wUsaN3OVqWsiqpSSqryKvMQvoDOYqA='
+
+# Background sprite, of constant combinators for each row
+BACKGROUND_BLUEPRINT = '0eNrtml9P2zAUxb+Lny8o107SphKv+xIIVWlrwFqbVI4Lq1C++3xtVhhjbPKfN6svyWnj341zenRUeGGb/UketRoMW70wtR2Hia1uX9ikHoZ+T9rQHyRbsZ3cqp3UV9vxsFFDb0bNZmBq2MkfbIUzfHIJLWb6wXx+DZ/vgMnBKKOkZ7qT83o4HTZS20Xhq4WAHcfJXjsORLTrXfHqugF2piPRXjeWtFNabv1HlkCrGD3u1xv52D8pu4S9bvLvT78f21kuN3Y3z3RzH2bj8MW+fD3a/w32uuzavrdTlxHfn9kh75WezPpt3835SCM9KW1OVrnM6D9x9Y12/9deuv21Qx977YZesRt7wfsV14M0z6P+7sha7tjK6JME9qCltIPf9/tJzvQQx5M5nsxH3/xjGPkk9dk8quGBpvoD5Va/sAg8/+VRiAibYGab1OE2qYpNktqkCbcJz50mbbBNeEmTtDZZRNgkd5osw21S0iStTbpwm2DuNMEq2CdY4iStTzCixGLuPMHwFoslUBIbJaLGVtkTJbzHViVREhsloshW2RMlvMlWJVESGyW8ymKXPVGCuyx2JVESG6WLMEruROFVuFFKoqQ1Cg8vs7jM/otscJnFZUmUxEYREUbJnih1uFFKoiQ2SniZxUX2RAkus7goiZLYKBFldpE9UcLL7KIkSmKjRJTZNneiiPAy25ZESfxn44gy2+ZOFBFeZtuSKImNElFmm+yJEl5mm5IoiY0SUWab7IkSXmabkiiJjRJRZuvsiRJeZuuSKDFGsbhnu3kEu0Xg9LqDWw4INaA9ElapnWbPoXVaY7XWafYclk5bWG3pNHsOWDmxs6I9JJUUQO5kJBB6EkmAnoUEQ08jCdDzkIDoiSQBeiYSFD2VJOAei8TlnksScM/l7gZf75C43HM5cbnnkgTcczlxueeSBNxzOXG555IEwnM5cYXnkgTCcwVxheeSBOJ1b4krPJckEJ4riCs8lyQQniuIK4hrn5oy8mCf/tt/0gKzDpjcd6BpeVd3XdPwphUc5/knqJDWIA=='
+
+TEMPLATES: dict[str, str] = {
+    'lut': LUT_BLUEPRINT,
+    'rom': ROM_BLUEPRINT,
+    'background': BACKGROUND_BLUEPRINT,
+}
+
+# Decoded templates, by name
+TEMPLATE_CACHE: dict[str, dict] = {}
+
+# Number of X columns in each bank, for LUTs built with `Accounter.build_banked()`
+BANK_WIDTH = 8
+
+# Pixels in each signal of a packed background, as 4-bit colors, see `pack_pixels()`
+BACKGROUND_PIXELS = 5
+
+# Rows in each word of `bitplanes()`, as the top bits of a signal are the sign, and the `flag` of `do_bitplane_logic()`
+BITPLANE_BITS = 30
+
+# Maximum number of inputs, across all signal domains, that `minimize()` will consider
+MINIMIZE_LIMIT = 4096
+
 # Dimensions (in px)
 HEIGHT = 93
 WIDTH = 84
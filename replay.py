@@ -0,0 +1,217 @@
+"""
+Deterministic input-replay harness, for recorded controller traces run through the reference engine in `engine.py`.
+
+A trace records the D1 input of a single game, and the resulting X, Y, score and lives streams, which are the golden
+outputs a replay is diffed against. Traces are stored as JSON in /replays/, and are compact and seekable:
+- D1 and each stream are run-length encoded, as `[step, value]` pairs for each step where the value changes
+- Every `snapshot_interval` steps, the full `State` of the game is stored (with dots bit packed), so a replay can start
+  from any step by restoring the latest snapshot before it
+
+The engine evaluates the LUTs in /data/, so after any change to the pacman/* or ghost/* logic, `python replay.py check`
+replays every trace at full speed (all traces are stepped together, as one batch) and reports the first step where each
+stream diverges. Use `python replay.py record` to record new golden traces, from a random controller.
+
+Usage:
+    python replay.py record --traces 8 --steps 2000
+    python replay.py check [--start STEP] [paths...]
+"""
+
+import os
+import glob
+import json
+import time
+import base64
+import argparse
+import numpy as np
+
+from typing import NamedTuple
+
+from main import HEIGHT, WIDTH
+from engine import Engine, State, Tables, load_tables
+
+
+class Trace(NamedTuple):
+    name: str
+    seed: int
+    steps: int
+    snapshot_interval: int
+    d1: list[list[int]]                  # RLE of D1, applied at each step
+    streams: dict[str, list[list[int]]]  # RLE of each of `STREAMS`, after each step
+    snapshots: list[dict]                # The `State` before every `snapshot_interval` steps, see `snapshot()`
+
+
+class Divergence(NamedTuple):
+    trace: str
+    stream: str
+    step: int
+    expected: int
+    actual: int
+
+    def __str__(self):
+        return 'REPLAY %s: %s diverges at step %d, expected %d, got %d' % self
+
+
+def record(tables: Tables, seeds: list[int], steps: int, snapshot_interval: int, turn_chance: float = 0.1) -> list[Trace]:
+    """ Records one trace for each seed, with D1 from a random controller seeded by it """
+    engine = Engine(tables, len(seeds), seeds=seeds)
+    d1 = np.stack([controller(seed, steps, turn_chance) for seed in seeds])
+    streams = np.zeros((len(seeds), len(STREAMS), steps), dtype=np.int64)
+    snapshots = [[] for _ in seeds]
+
+    for step in range(steps):
+        if step % snapshot_interval == 0:
+            for game in range(len(seeds)):
+                snapshots[game].append(snapshot(engine.state, game, step))
+        engine.step(d1[:, step])
+        streams[:, :, step] = sample(engine.state)
+
+    return [
+        Trace(
+            'seed_%d' % seed, seed, steps, snapshot_interval, rle_encode(d1[game]),
+            {name: rle_encode(streams[game, i]) for i, name in enumerate(STREAMS)}, snapshots[game]
+        )
+        for game, seed in enumerate(seeds)
+    ]
+
+
+def replay(tables: Tables, traces: list[Trace], start: int = 0) -> list[np.ndarray]:
+    """
+    Replays each trace from `start`, restoring the latest snapshot at or before it, and returns the [stream, step] values
+    of each trace, for every step from `start` to the end of the trace. Traces are stepped together in batches, one for
+    each distinct snapshot step.
+    """
+    results = [None] * len(traces)
+    groups = {}
+    for i, trace in enumerate(traces):
+        groups.setdefault(min(start, trace.steps) // trace.snapshot_interval * trace.snapshot_interval, []).append(i)
+
+    for begin, group in groups.items():
+        steps = max(traces[i].steps for i in group)
+        engine = Engine(tables, len(group), seeds=[traces[i].seed for i in group])
+        for game, i in enumerate(group):
+            restore(engine.state, game, next(s for s in traces[i].snapshots if s['step'] == begin))
+        d1 = np.stack([rle_decode(traces[i].d1, steps) for i in group])
+        streams = np.zeros((len(group), len(STREAMS), steps), dtype=np.int64)
+        for step in range(begin, steps):
+            engine.step(d1[:, step])
+            streams[:, :, step] = sample(engine.state)
+        for game, i in enumerate(group):
+            results[i] = streams[game, :, start:traces[i].steps]
+    return results
+
+
+def check(tables: Tables, traces: list[Trace], start: int = 0) -> list[Divergence]:
+    """ Replays each trace from `start`, and returns the first divergence from the golden trace in each stream """
+    divergences = []
+    for trace, actual in zip(traces, replay(tables, traces, start)):
+        for i, name in enumerate(STREAMS):
+            expected = rle_decode(trace.streams[name], trace.steps)[start:]
+            diverged = np.flatnonzero(expected != actual[i])
+            if diverged.size > 0:
+                step = diverged[0]
+                divergences.append(Divergence(trace.name, name, start + int(step), int(expected[step]), int(actual[i, step])))
+    return divergences
+
+
+def controller(seed: int, steps: int, turn_chance: float) -> np.ndarray:
+    """ D1 for each step, which holds a direction (or -1), and changes to a random one with probability `turn_chance` """
+    rng = np.random.default_rng(seed)
+    change = rng.random(steps) < turn_chance
+    change[0] = True
+    values = rng.integers(-1, 4, steps)
+    return values[np.maximum.accumulate(np.where(change, np.arange(steps), 0))]
+
+
+def sample(state: State) -> np.ndarray:
+    """ The value of each of `STREAMS`, for each game, as [game, stream] """
+    return np.stack([state.pacman[:, 0], state.pacman[:, 1], state.score, state.lives], axis=1)
+
+
+def snapshot(state: State, game: int, step: int) -> dict:
+    """ The state of a single game, as JSON """
+    snap = {'step': step}
+    for field in State._fields:
+        value = getattr(state, field)[game]
+        if field == 'dots':
+            snap[field] = base64.b64encode(np.packbits(value).tobytes()).decode('ascii')
+        else:
+            snap[field] = value.tolist()
+    return snap
+
+
+def restore(state: State, game: int, snap: dict):
+    """ Restores the state of a single game from a `snapshot()` """
+    for field in State._fields:
+        if field == 'dots':
+            bits = np.unpackbits(np.frombuffer(base64.b64decode(snap[field]), dtype=np.uint8), count=WIDTH * HEIGHT)
+            state.dots[game] = bits.reshape(WIDTH, HEIGHT).astype(bool)
+        else:
+            getattr(state, field)[game] = snap[field]
+
+
+def rle_encode(values: np.ndarray) -> list[list[int]]:
+    """ Encodes `values` as `[index, value]` pairs, for each index where the value changes """
+    changes = np.flatnonzero(np.diff(values, prepend=values[0] - 1))
+    return [[int(i), int(values[i])] for i in changes]
+
+
+def rle_decode(runs: list[list[int]], n: int) -> np.ndarray:
+    """ The inverse of `rle_encode()`, for `n` values. Values past the last run are held """
+    index, values = np.array(runs).T
+    return values[np.searchsorted(index, np.arange(n), side='right') - 1]
+
+
+def load(path: str) -> Trace:
+    with open(path, 'r', encoding='utf-8') as f:
+        return Trace(**json.load(f))
+
+
+def save(trace: Trace, directory: str):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, trace.name + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(trace._asdict(), f, separators=(',', ':'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Records, or checks, controller traces against the reference engine')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_record = commands.add_parser('record', help='Records new golden traces, from a random controller')
+    parser_record.add_argument('--traces', type=int, default=8, help='Number of traces to record')
+    parser_record.add_argument('--steps', type=int, default=2000, help='Number of steps to record each trace for')
+    parser_record.add_argument('--seed', type=int, default=0, help='Seed of the first trace, which are numbered consecutively')
+    parser_record.add_argument('--snapshot-interval', type=int, default=SNAPSHOT_INTERVAL, help='Steps between each state snapshot')
+    parser_record.add_argument('--out', default=REPLAYS, help='Directory to write traces to')
+
+    parser_check = commands.add_parser('check', help='Replays traces, and diffs them against their golden streams')
+    parser_check.add_argument('paths', nargs='*', help='Trace files to check, by default every trace in /replays/')
+    parser_check.add_argument('--start', type=int, default=0, help='Step to start replaying from, using the latest snapshot before it')
+
+    args = parser.parse_args()
+    tables = load_tables()
+
+    if args.command == 'record':
+        seeds = list(range(args.seed, args.seed + args.traces))
+        for trace in record(tables, seeds, args.steps, args.snapshot_interval):
+            save(trace, args.out)
+            print('REPLAY recorded %s: %d steps, %d D1 changes, final score %d' % (trace.name, trace.steps, len(trace.d1), trace.streams['score'][-1][1]))
+        return
+
+    traces = [load(path) for path in (args.paths or sorted(glob.glob(os.path.join(REPLAYS, '*.json'))))]
+    start = time.perf_counter()
+    divergences = check(tables, traces, args.start)
+    steps = sum(max(0, trace.steps - args.start) for trace in traces)
+    print('REPLAY %d traces, %d steps in %.2fs' % (len(traces), steps, time.perf_counter() - start))
+    for divergence in divergences:
+        print(divergence)
+    if divergences:
+        raise ValueError('Replays diverged: %s' % ', '.join(sorted({d.trace for d in divergences})))
+
+
+REPLAYS = 'replays'
+STREAMS = ('x', 'y', 'score', 'lives')
+SNAPSHOT_INTERVAL = 250
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,436 @@
+"""
+Headless simulator for the decider, arithmetic and constant combinators used by the blueprints in /data/, so they can be
+verified without pasting them into the game.
+
+All signals are evaluated over a batch of inputs at once, so a LUT can be checked over its entire input domain in a single
+call, i.e. for a LUT from (X, Y) -> T:
+
+```
+xs, ys = np.meshgrid(np.arange(WIDTH), np.arange(HEIGHT), indexing='ij')
+circuit = Circuit(decode_blueprint_string(text))
+outputs = circuit.settle(red={'X': xs.ravel(), 'Y': ys.ravel()})
+outputs['T']  # Value of T for each (X, Y)
+```
+
+Each combinator reads its red (1) and green (2) input networks, and writes to both of it's output (3, 4) networks. Networks
+which are only read from are external inputs, to which the `red` and `green` inputs are added, and networks which are only
+written to are external outputs, which are summed to produce the result. Each tick, every combinator computes it's output
+from the networks as they were on the previous tick, whereas constant combinators always output their values.
+"""
+
+import numpy as np
+
+from typing import Iterable
+from collections import defaultdict
+
+from main import QUALITY
+
+
+Signal = tuple[str, str]  # (name, quality)
+
+
+def signal_key(signal: 'str | Signal | dict') -> Signal:
+    """
+    Returns the signal for `signal`, which is either a signal dict from a blueprint, a (name, quality) pair, or a name.
+    Names are either Factorio names, or as used by `Term` in main.py, a letter and optional quality, i.e. 'D2' -> (signal-D, uncommon).
+    """
+    if isinstance(signal, dict):
+        return signal['name'], signal.get('quality', QUALITY[0])
+    if isinstance(signal, tuple):
+        return signal
+    if len(signal) <= 2:
+        return 'signal-%s' % signal[0], QUALITY[0 if len(signal) == 1 else int(signal[1]) - 1]
+    return signal, QUALITY[0]
+
+
+def wrap(values: np.ndarray) -> np.ndarray:
+    """ Wraps to signed 32-bit values, as Factorio signals do on overflow. Values are kept as int32, so sums wrap implicitly """
+    return np.asarray(values).astype(np.int32, copy=False)
+
+
+class Outputs:
+    """ The signals on the external output networks of a `Circuit`, by signal, each an array over the batch """
+    def __init__(self, values: np.ndarray, index: dict[Signal, int]):
+        self.values = values
+        self.index = index
+
+    def __getitem__(self, signal: 'str | Signal') -> np.ndarray:
+        key = signal_key(signal)
+        if key not in self.index:
+            return np.zeros(self.values.shape[0], dtype=np.int32)
+        return self.values[:, self.index[key]]
+
+    def nonzero(self) -> dict[Signal, np.ndarray]:
+        """ Every signal which is non-zero for any input in the batch """
+        return {key: self.values[:, i] for key, i in self.index.items() if self.values[:, i].any()}
+
+
+class Circuit:
+    """
+    A simulation of a blueprint's combinators, and the networks between them, over a batch of inputs. See the module docstring.
+    """
+    def __init__(self, blueprint: dict, signals: Iterable['str | Signal'] = ()):
+        self.entities: list[dict] = [e for e in blueprint['blueprint']['entities'] if e['name'] in COMBINATORS]
+        numbers = {e['entity_number'] for e in self.entities}
+
+        # Every signal referenced, so each network can be a dense array of [batch, signal]
+        self.index: dict[Signal, int] = {}
+        for key in map(signal_key, signals):
+            self.index.setdefault(key, len(self.index))
+        for entity in self.entities:
+            for key in Circuit.signals_of(entity):
+                self.index.setdefault(key, len(self.index))
+
+        # Networks, as the connected components of (entity, connector) via wires
+        parent: dict[tuple[int, int], tuple[int, int]] = {}
+
+        def find(node):
+            while parent.setdefault(node, node) != node:
+                parent[node] = node = parent[parent[node]]
+            return node
+
+        for e1, c1, e2, c2 in blueprint['blueprint'].get('wires', ()):
+            if e1 in numbers and e2 in numbers:
+                parent[find((e1, c1))] = find((e2, c2))
+
+        readers: dict[tuple[int, int], list[int]] = defaultdict(list)
+        writers: dict[tuple[int, int], list[int]] = defaultdict(list)
+        wired = {(e, c) for e1, c1, e2, c2 in blueprint['blueprint'].get('wires', ()) for e, c in ((e1, c1), (e2, c2))}
+        self.reads: dict[int, tuple[tuple[int, int], tuple[int, int]]] = {}
+        self.writes: dict[int, set[tuple[int, int]]] = {}
+        for entity in self.entities:
+            n = entity['entity_number']
+            if entity['name'] != 'constant-combinator':
+                self.reads[n] = find((n, 1)), find((n, 2))
+                for net in self.reads[n]:
+                    readers[net].append(n)
+            self.writes[n] = {find((n, c)) for c in ((1, 2) if entity['name'] == 'constant-combinator' else (3, 4))}
+            for net in self.writes[n]:
+                writers[net].append(n)
+
+        # External outputs are the entities writing to networks which are only written to, counting each entity once. If an
+        # entity has wired outputs, any unwired outputs are ignored, as they are not part of the circuit.
+        self.external_inputs = {net for net in readers if net not in writers}
+        self.external_outputs = []
+        for entity in self.entities:
+            n = entity['entity_number']
+            nodes = [(n, c) for c in ((1, 2) if entity['name'] == 'constant-combinator' else (3, 4))]
+            nodes = [node for node in nodes if node in wired] or nodes[:1]
+            if any(find(node) not in readers for node in nodes):
+                self.external_outputs.append(n)
+        self.find = find
+        self.writers = writers
+        self.outputs: dict[int, np.ndarray] = {}
+        self.networks: dict[tuple[int, int], np.ndarray] = {}
+        self.changed: set[int] = set()
+        self.inputs: dict[str, np.ndarray] = {}
+        self.batch = 0
+
+    def reset(self, batch: int):
+        """ Resets every combinator to outputting nothing, for a batch of `batch` inputs """
+        self.batch = batch
+        self.outputs = {e['entity_number']: self.constant(e) for e in self.entities}
+        self.networks = {}
+        self.changed = set(self.outputs)
+        self.inputs = {}
+
+    def settle(self, red: dict | None = None, green: dict | None = None, limit: int | None = None) -> Outputs:
+        """
+        Resets, then steps with constant inputs until no combinator's output changes, and returns the external outputs.
+        Inputs are either arrays over the batch, or single values.
+        """
+        red, green = red or {}, green or {}
+        limit = len(self.entities) + 2 if limit is None else limit
+        self.reset(max([1] + [np.size(v) for v in (*red.values(), *green.values())]))
+        for _ in range(limit):
+            if not self.step(red, green):
+                return self.read()
+        raise ValueError('Circuit did not settle within %d ticks' % limit)
+
+    def run(self, ticks: int, red: dict | None = None, green: dict | None = None) -> Outputs:
+        """ Steps `ticks` times with constant inputs, without resetting, and returns the external outputs """
+        if not self.outputs:
+            self.reset(max([1] + [np.size(v) for v in (*(red or {}).values(), *(green or {}).values())]))
+        for _ in range(ticks):
+            self.step(red or {}, green or {})
+        return self.read()
+
+    def step(self, red: dict, green: dict) -> bool:
+        """
+        Advances one tick, where every combinator reads the networks as they are, including `red` and `green` inputs.
+        Only networks whose writers or inputs changed are recomputed, and only combinators reading those are evaluated.
+        Returns `True` if anything changed.
+        """
+        dirty = {net for n in self.changed for net in self.writes[n]}
+        for color, values in (('red', red), ('green', green)):
+            vector = self.vector(values)
+            if color not in self.inputs or not np.array_equal(self.inputs[color], vector):
+                self.inputs[color] = vector
+                dirty |= {net for net in self.external_inputs if (net[1] in (1, 3)) == (color == 'red')}
+        
+        for net in dirty:
+            value = self.inputs['red' if net[1] in (1, 3) else 'green'] if net in self.external_inputs else 0
+            for n in self.writers.get(net, ()):
+                value = value + self.outputs[n]
+            self.networks[net] = wrap(np.broadcast_to(value, (self.batch, len(self.index))))
+
+        outputs = dict(self.outputs)
+        changed = set()
+        for entity in self.entities:
+            n = entity['entity_number']
+            if n in self.reads and (self.reads[n][0] in dirty or self.reads[n][1] in dirty):
+                red_network, green_network = (self.networks.get(net, self.zeros()) for net in self.reads[n])
+                if entity['name'] == 'decider-combinator':
+                    outputs[n] = self.decider(entity, red_network, green_network)
+                else:
+                    outputs[n] = self.arithmetic(entity, red_network, green_network)
+                if not np.array_equal(outputs[n], self.outputs[n]):
+                    changed.add(n)
+        
+        self.outputs = outputs
+        self.changed = changed
+        return bool(changed or dirty)
+
+    def read(self) -> Outputs:
+        """ The sum of all external outputs """
+        value = self.zeros()
+        for n in self.external_outputs:
+            value = value + self.outputs[n]
+        return Outputs(wrap(value), self.index)
+
+    def zeros(self) -> np.ndarray:
+        return np.zeros((self.batch, len(self.index)), dtype=np.int32)
+
+    def vector(self, values: dict) -> np.ndarray:
+        """ Converts {signal: value(s)} into a dense [batch, signal] array """
+        vector = np.zeros((self.batch, len(self.index)), dtype=np.int32)
+        for signal, value in values.items():
+            key = signal_key(signal)
+            if key not in self.index:
+                raise ValueError('Input signal %s is not used by any combinator' % (key,))
+            vector[:, self.index[key]] = value
+        return vector
+
+    def constant(self, entity: dict) -> np.ndarray:
+        """ The output of `entity` if it is a constant combinator, otherwise nothing, as a single row which is broadcast over the batch """
+        value = np.zeros((1, len(self.index)), dtype=np.int32)
+        behavior = entity.get('control_behavior', {})
+        if entity['name'] == 'constant-combinator' and behavior.get('is_on', True):
+            for section in behavior.get('sections', {}).get('sections', ()):
+                if section.get('active', True):
+                    for f in section.get('filters', ()):
+                        value[:, self.index[signal_key(f)]] += f.get('count', 0)
+        return wrap(value)
+
+    def read_networks(self, red: np.ndarray, green: np.ndarray, networks: dict | None, signal: dict | None = None) -> np.ndarray:
+        """
+        Input signals from the selected networks, where unspecified networks means both. If `signal` is given, this is just
+        the [batch] values of that signal, otherwise all [batch, signal] values.
+        """
+        networks = networks or {}
+        if signal is not None:
+            i = self.index[signal_key(signal)]
+            red, green = red[:, i], green[:, i]
+        if networks.get('red', True) and networks.get('green', True):
+            return wrap(red + green)
+        if networks.get('red', True):
+            return red
+        if networks.get('green', True):
+            return green
+        return np.zeros_like(red)
+
+    def decider(self, entity: dict, red: np.ndarray, green: np.ndarray) -> np.ndarray:
+        """
+        Evaluates a decider combinator, where conditions are OR-ed groups of AND-ed conditions. Each condition is either
+        [batch] shaped, or [batch, signal] shaped if it uses signal-each, in which case the output signal-each is each signal
+        for which the conditions are true.
+        """
+        behavior = entity['control_behavior']['decider_conditions']
+        result = self.conditions(entity, red, green)
+
+        output = np.zeros((self.batch, len(self.index)), dtype=np.int32)
+        for out in behavior.get('outputs', ()):
+            if 'signal' not in out:
+                continue
+            match out['signal']['name']:
+                case 'signal-everything' | 'signal-each':
+                    values = self.read_networks(red, green, out.get('networks'))
+                    if not out.get('copy_count_from_input', True):
+                        values = np.where(values != 0, out.get('constant', 1), 0)
+            match out['signal']['name']:
+                case 'signal-everything':
+                    mask = result if result.ndim == 2 else result[:, None]
+                    output += np.where(mask, values, 0)
+                case 'signal-each':
+                    assert result.ndim == 2, 'Output signal-each requires a condition on signal-each'
+                    output += np.where(result, values, 0)
+                case 'signal-anything':
+                    raise ValueError('Output signal-anything is not supported')
+                case _:
+                    i = self.index[signal_key(out['signal'])]
+                    count = self.read_networks(red, green, out.get('networks'), out['signal']) if out.get('copy_count_from_input', True) else out.get('constant', 1)
+                    output[:, i] += np.where(result.any(axis=1) if result.ndim == 2 else result, count, 0)
+        return wrap(output)
+
+    def conditions(self, entity: dict, red: np.ndarray, green: np.ndarray) -> np.ndarray:
+        """ Evaluates the conditions of a decider combinator, see `decider()` """
+        groups: list[np.ndarray] = []
+        for i, condition in enumerate(entity['control_behavior']['decider_conditions'].get('conditions', ())):
+            value = self.condition(condition, red, green)
+            if i == 0 or condition.get('compare_type', 'or') == 'or':
+                groups.append(value)
+            else:
+                groups[-1] = broadcast(groups[-1], value) & broadcast(value, groups[-1])
+        result = np.zeros(self.batch, dtype=bool)
+        for group in groups:
+            result = broadcast(result, group) | broadcast(group, result)
+        return result
+
+    def fires(self, red: dict | None = None, green: dict | None = None) -> dict[int, np.ndarray]:
+        """
+        Evaluates just the conditions of every decider combinator, by entity number, for the given inputs on both of it's
+        input networks, ignoring any wires. This is used to check LUTs, where each decider is a case of the LUT.
+        """
+        red, green = red or {}, green or {}
+        self.reset(max([1] + [np.size(v) for v in (*red.values(), *green.values())]))
+        red_network, green_network = self.vector(red), self.vector(green)
+        return {
+            e['entity_number']: self.conditions(e, red_network, green_network)
+            for e in self.entities
+            if e['name'] == 'decider-combinator'
+        }
+
+    def evaluations(self, red: dict | None = None, green: dict | None = None) -> dict[int, np.ndarray]:
+        """
+        The number of conditions each decider combinator evaluates, by entity number, once settled with the given inputs.
+        Conditions are evaluated in order, until the result is known: each AND group stops at it's first false condition,
+        and the decider stops at it's first true group. So a decider gated off (i.e. a bank which is not selected) only
+        evaluates conditions against an empty network.
+        """
+        self.settle(red, green)
+        counts = {}
+        for entity in self.entities:
+            n = entity['entity_number']
+            if entity['name'] != 'decider-combinator':
+                continue
+            red_network, green_network = (self.networks.get(net, self.zeros()) for net in self.reads[n])
+            count = np.zeros(self.batch, dtype=np.int32)
+            done = np.zeros(self.batch, dtype=bool)
+            group = np.ones(self.batch, dtype=bool)
+            for i, condition in enumerate(entity['control_behavior']['decider_conditions'].get('conditions', ())):
+                if i != 0 and condition.get('compare_type', 'or') == 'or':
+                    done |= group
+                    group = np.ones(self.batch, dtype=bool)
+                count += ~done & group
+                value = self.condition(condition, red_network, green_network)
+                group &= value.any(axis=1) if value.ndim == 2 else value
+            counts[n] = count
+        return counts
+
+    def condition(self, condition: dict, red: np.ndarray, green: np.ndarray) -> np.ndarray:
+        """ Evaluates a single condition, see `decider()` """
+        if 'first_signal' not in condition:
+            return np.zeros(self.batch, dtype=bool)
+        if 'second_signal' in condition:
+            second = self.read_networks(red, green, condition.get('second_signal_networks'), condition['second_signal'])
+        else:
+            second = np.full(self.batch, condition.get('constant', 0))
+
+        op = COMPARATORS[condition.get('comparator', '<')]
+        name = condition['first_signal']['name']
+        first = self.read_networks(red, green, condition.get('first_signal_networks'), None if name in WILDCARDS else condition['first_signal'])
+        match name:
+            case 'signal-each':
+                return (first != 0) & op(first, second[:, None])
+            case 'signal-anything':
+                return ((first != 0) & op(first, second[:, None])).any(axis=1)
+            case 'signal-everything':
+                return ((first == 0) | op(first, second[:, None])).all(axis=1)
+            case _:
+                return op(first, second)
+
+    def arithmetic(self, entity: dict, red: np.ndarray, green: np.ndarray) -> np.ndarray:
+        """ Evaluates an arithmetic combinator, where signal-each as the first signal applies the operation to each signal """
+        conditions = entity['control_behavior']['arithmetic_conditions']
+        op = OPERATIONS[conditions.get('operation', '*')]
+
+        if 'second_signal' in conditions:
+            second = self.read_networks(red, green, conditions.get('second_signal_networks'), conditions['second_signal'])
+        else:
+            second = np.full(self.batch, conditions.get('second_constant', 0), dtype=np.int32)
+
+        output = np.zeros((self.batch, len(self.index)), dtype=np.int32)
+        if 'output_signal' not in conditions:
+            return output
+        out = signal_key(conditions['output_signal'])
+
+        if conditions.get('first_signal', {}).get('name') == 'signal-each':
+            first = self.read_networks(red, green, conditions.get('first_signal_networks'))
+            values = np.where(first != 0, wrap(op(first, second[:, None])), 0)
+            if out[0] == 'signal-each':
+                return values
+            output[:, self.index[out]] = wrap(values.sum(axis=1))
+            return output
+
+        if 'first_signal' in conditions:
+            first = self.read_networks(red, green, conditions.get('first_signal_networks'), conditions['first_signal'])
+        else:
+            first = np.full(self.batch, conditions.get('first_constant', 0), dtype=np.int32)
+        output[:, self.index[out]] = wrap(op(first, second))
+        return output
+
+    @staticmethod
+    def signals_of(entity: dict) -> Iterable[Signal]:
+        """ All non-wildcard signals used by a combinator """
+        behavior = entity.get('control_behavior', {})
+        for section in behavior.get('sections', {}).get('sections', ()):
+            for f in section.get('filters', ()):
+                yield signal_key(f)
+        decider = behavior.get('decider_conditions', {})
+        arithmetic = behavior.get('arithmetic_conditions', {})
+        signals = [
+            *(c.get(k) for c in decider.get('conditions', ()) for k in ('first_signal', 'second_signal')),
+            *(o.get('signal') for o in decider.get('outputs', ())),
+            *(arithmetic.get(k) for k in ('first_signal', 'second_signal', 'output_signal')),
+        ]
+        for signal in signals:
+            if signal is not None and signal['name'] not in WILDCARDS:
+                yield signal_key(signal)
+
+
+def broadcast(value: np.ndarray, other: np.ndarray) -> np.ndarray:
+    """ Broadcasts a [batch] condition against a [batch, signal] one """
+    return value[:, None] if value.ndim < other.ndim else value
+
+
+def divide(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """ Integer division, rounding towards zero, where division by zero is zero """
+    safe = np.where(b == 0, 1, b)
+    return np.where(b == 0, 0, np.sign(a) * np.sign(safe) * (np.abs(a) // np.abs(safe)))
+
+
+COMBINATORS = ('constant-combinator', 'decider-combinator', 'arithmetic-combinator')
+WILDCARDS = ('signal-each', 'signal-anything', 'signal-everything')
+
+COMPARATORS = {
+    '=': np.equal,
+    '≠': np.not_equal,
+    '<': np.less,
+    '>': np.greater,
+    '≤': np.less_equal,
+    '≥': np.greater_equal,
+}
+
+OPERATIONS = {
+    '+': np.add,
+    '-': np.subtract,
+    '*': np.multiply,
+    '/': divide,
+    '%': lambda a, b: np.where(b == 0, 0, a - b * divide(a, b)),
+    '^': lambda a, b: np.where(b < 0, 0, wrap(np.power(a, np.maximum(b, 0)))),
+    '<<': lambda a, b: np.left_shift(a, b & 31),
+    '>>': lambda a, b: np.right_shift(wrap(a), b & 31),
+    'AND': np.bitwise_and,
+    'OR': np.bitwise_or,
+    'XOR': np.bitwise_xor,
+}
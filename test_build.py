@@ -0,0 +1,46 @@
+"""
+End to end tests of the build: builds /data/, then runs the checks in `checks.py` and `timing.py`, and replays a golden
+trace from /replays/ through the reference engine. Run with `pytest` from the repository root.
+"""
+
+import os
+import sys
+import subprocess
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def build() -> str:
+    """ Runs an incremental build, without it's own checks, returning it's output """
+    result = subprocess.run([sys.executable, 'main.py', '--no-check'], cwd=ROOT, capture_output=True, text=True, check=True)
+    return result.stdout
+
+
+@pytest.fixture(scope='session', autouse=True)
+def built():
+    os.chdir(ROOT)
+    build()
+
+
+def test_checks():
+    from checks import check_all
+    check_all()
+
+
+def test_timing():
+    from timing import check_timing
+    check_timing()
+
+
+def test_replay():
+    from engine import load_tables
+    from replay import REPLAYS, check, load
+    trace = load(os.path.join(REPLAYS, 'seed_0.json'))
+    assert check(load_tables(), [trace]) == []
+
+
+def test_rebuild_is_up_to_date():
+    output = build()
+    assert 'UP TO DATE dots_*' in output
+    assert not [line for line in output.splitlines() if line.startswith(('RANGES', 'BITPLANES', 'PACKED', 'BANKED', 'BACKGROUND'))]
@@ -0,0 +1,180 @@
+"""
+Unit tests of the generator in `main.py`, which don't need a build. Run with `pytest` from the repository root.
+"""
+
+import os
+import sys
+import zlib
+import operator
+import itertools
+import linecache
+import importlib
+import pytest
+import numpy as np
+
+import main
+
+from main import BANK_WIDTH, BITPLANE_BITS, BUILD_DEFINITIONS, Accounter, BuildCache, Direction, Term, Term3, bitplanes, build_packed, clear_terms, decode_blueprint_string, encode_blueprint_string, group_by_value, iter_encode_blueprint, minimize, position_ranges
+from simulator import Circuit
+
+
+def holds(term: Term3, values: dict[str, int]) -> bool:
+    """ If `term` is true, where each signal has the value in `values` """
+    return any(all(COMPARATORS[c.op](values[str(c.lhs)], c.rhs) for c in product.and_values) for product in term.or_values)
+
+
+def position_table(width: int, height: int, seed: int = 0) -> dict[tuple[int, int], int]:
+    """ A random LUT from (X, Y) -> [1, 3], over about half of the positions in a `width` x `height` grid """
+    rng = np.random.default_rng(seed)
+    return {(x, y): int(rng.integers(1, 4)) for x in range(width) for y in range(height) if rng.random() < 0.5}
+
+
+def position_accounter(table: dict[tuple[int, int], int]) -> Accounter:
+    """ An accounter for `table`, as built by `write_position_lut()` """
+    acc = Accounter()
+    for value, positions in group_by_value(table).items():
+        acc.if_then(position_ranges(positions), Term('M') == value)
+    return acc
+
+
+def lookup(blueprint: dict, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """ The output M of the LUT `blueprint`, for each (X, Y) """
+    inputs = {'X': xs, 'Y': ys}
+    return Circuit(blueprint, inputs).settle(red=inputs)['M']
+
+
+def load_module(path, text: str):
+    """ Writes `text` as a module at `path`, and imports it """
+    path.write_text(text, encoding='utf-8')
+    BUILD_DEFINITIONS.pop(str(path), None)
+    linecache.clearcache()
+    sys.modules.pop(path.stem, None)
+    sys.path.insert(0, str(path.parent))
+    try:
+        return importlib.import_module(path.stem)
+    finally:
+        sys.path.remove(str(path.parent))
+
+
+def test_build_cache_hash_covers_referenced_definitions(tmp_path):
+    source = 'WIDTH = 8\n\ndef helper():\n    return WIDTH\n\ndef generate(n):\n    return helper() * n\n\ndef unused():\n    return 1\n'
+    key = BuildCache.hash(load_module(tmp_path / 'stage.py', source).generate, 1)
+    assert BuildCache.hash(load_module(tmp_path / 'stage.py', source).generate, 1) == key
+    assert BuildCache.hash(load_module(tmp_path / 'stage.py', source).generate, 2) != key
+    assert BuildCache.hash(load_module(tmp_path / 'stage.py', source.replace('WIDTH = 8', 'WIDTH = 9')).generate, 1) != key
+    assert BuildCache.hash(load_module(tmp_path / 'stage.py', source.replace('* n', '+ n')).generate, 1) != key
+    assert BuildCache.hash(load_module(tmp_path / 'stage.py', source.replace('return 1', 'return 2')).generate, 1) == key
+
+
+def test_build_cache_hash_covers_nested_callables():
+    key = BuildCache.hash(main.do_entity_tile_type_logic, (main.TileType.to_player_type,))
+    assert BuildCache.hash(main.do_entity_tile_type_logic, (main.TileType.to_player_type,)) == key
+    assert BuildCache.hash(main.do_entity_tile_type_logic, (lambda t: t,)) != key
+
+
+def test_build_cache_is_up_to_date(tmp_path):
+    output = tmp_path / 'output.txt'
+    output.write_text('', encoding='utf-8')
+    cache = BuildCache(str(tmp_path / 'manifest.json'))
+    assert not cache.is_up_to_date('stage', 'a')
+
+    cache.update('stage', 'a', [str(output)], {str(output): {'conditions': 1}})
+    cache.save()
+    cache = BuildCache(str(tmp_path / 'manifest.json'))
+    assert cache.is_up_to_date('stage', 'a')
+    assert not cache.is_up_to_date('stage', 'b')
+    assert cache.costs() == {str(output): {'conditions': 1}}
+    assert not BuildCache(str(tmp_path / 'manifest.json'), force=True).is_up_to_date('stage', 'a')
+
+    os.remove(output)
+    assert not cache.is_up_to_date('stage', 'a')
+
+
+def test_minimize_is_equal_on_declared_domains():
+    d1, d2, d3 = (Term(name, Direction.all_or_none()) for name in ('D1', 'D2', 'D3'))
+    m1, m3 = Term('M1', (0, 1)), Term('M3', (0, 1))
+    term = Term3([]) | (
+        ((d1 == -1) & (d2 != -1) & (d3 == -1)) |
+        ((d1 != -1) & (d2 != -1) & (m1 == 0)) |
+        ((d1 == -1) & (d2 != -1) & (d3 != -1) & (m3 == 0))
+    )
+    minimized = minimize(term)
+    assert sum(map(len, (p.and_values for p in minimized.or_values))) < sum(map(len, (p.and_values for p in term.or_values)))
+
+    signals = (d1, d2, d3, m1, m3)
+    for values in itertools.product(*(signal.domain for signal in signals)):
+        values = {str(signal): value for signal, value in zip(signals, values)}
+        assert holds(minimized, values) == holds(term, values), values
+
+
+def test_minimize_keeps_undeclared_values():
+    x = Term('X')
+    term = Term3([]) | ((x == 1) | (x == 2))
+    minimized = minimize(term)
+    for value in range(-1, 5):
+        assert holds(minimized, {'X': value}) == (value in (1, 2))
+
+
+def test_position_ranges_matches_exactly_the_positions():
+    positions = {(x, 0) for x in range(6)} | {(0, y) for y in range(6)} | {(x, y) for x in range(3, 6) for y in range(3, 6)} | {(9, 9)}
+    term = position_ranges(positions)
+    for x in range(-1, 11):
+        for y in range(-1, 11):
+            assert holds(term, {'X': x, 'Y': y}) == ((x, y) in positions), (x, y)
+    assert sum(len(p.and_values) for p in term.or_values) < 2 * len(positions)
+
+
+def test_build_banked_equals_build():
+    table = position_table(3 * BANK_WIDTH + 3, 12)
+    xs, ys = (a.ravel() for a in np.meshgrid(np.arange(3 * BANK_WIDTH + 3), np.arange(12), indexing='ij'))
+    expected = lookup(position_accounter(table).build(), xs, ys)
+    assert np.array_equal(lookup(position_accounter(table).build_banked(BANK_WIDTH), xs, ys), expected)
+    assert np.array_equal(expected, [table.get((x, y), 0) for x, y in zip(xs, ys)])
+
+
+def test_build_packed_equals_build():
+    table = position_table(10, 90, seed=1)  # 15 values per word, so 6 words per column, over 2 planes
+    xs, ys = (a.ravel() for a in np.meshgrid(np.arange(10), np.arange(90), indexing='ij'))
+    expected = lookup(position_accounter(table).build(), xs, ys)
+    assert np.array_equal(lookup(build_packed(table, 'M'), xs, ys), expected)
+
+
+def test_iter_encode_blueprint_round_trips():
+    blueprint = position_accounter(position_table(40, 40, seed=2)).build()
+    for level in (0, 1, 9):
+        for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+            text = '0' + ''.join(iter_encode_blueprint(blueprint, level, strategy))
+            assert decode_blueprint_string(text) == blueprint
+    assert decode_blueprint_string(encode_blueprint_string({'blueprint': {}})) == {'blueprint': {}}
+
+
+def test_bitplanes_splits_columns_across_words():
+    for stride, offset in ((1, 0), (3, 1)):
+        rows = (offset + 2 * BITPLANE_BITS + 5) * stride  # 3 words per column
+        mask = np.zeros((6, rows), dtype=bool)
+        mask[:, offset * stride::stride] = np.random.default_rng(stride).random((6, rows // stride - offset)) < 0.5
+        mask[0, -stride] = True  # The last row, in the last word
+
+        words = bitplanes(mask, stride, offset)
+        assert words.shape == (6, 3)
+        assert (words >= 0).all() and (words < 1 << BITPLANE_BITS).all()
+
+        decoded = np.zeros_like(mask)
+        for x, w, bit in zip(*np.nonzero((words[:, :, None] >> np.arange(BITPLANE_BITS)) & 1)):
+            decoded[x, (w * BITPLANE_BITS + bit + offset) * stride] = True
+        assert np.array_equal(decoded, mask)
+
+
+def test_terms_are_interned_by_signal():
+    clear_terms()
+    signal = Term('Q')
+    assert Term('Q', (0, 1)) is signal and signal.domain == (0, 1)
+    assert Term('Q') is signal and signal.domain == (0, 1)
+    assert (signal == 1) is (Term('Q') == 1)
+    with pytest.raises(ValueError):
+        Term('Q', (0, 1, 2))
+    clear_terms()
+    assert Term('Q') is not signal and Term('Q').domain is None
+
+
+COMPARATORS = {'=': operator.eq, '\u2260': operator.ne, '<': operator.lt, '\u2264': operator.le, '>': operator.gt, '\u2265': operator.ge}
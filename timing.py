@@ -0,0 +1,187 @@
+"""
+Static timing analysis of the logic paths in the game, against the game logic clock.
+
+The latency of each artifact in /data/ is it's combinator depth: the longest chain of decider and arithmetic combinators
+from an external input network to an external output, where each combinator adds one tick, and constant combinators add
+none. The wiring between artifacts is declared in `PATHS`, as a sequence of stages, where each stage is either:
+- An artifact, i.e. 'pacman/tile_type'
+- A tuple of artifacts which run in parallel on the same inputs, costing the slowest of them
+- A `Fixed` latency, for logic in the game which isn't generated, i.e. the 1-tick buffer on reading a bus
+
+Only the game logic paths are modeled. The rendering pipeline (X-translator, Y-translator, grouping and color mapping) is
+out of scope: it is not generated here (only it's constant inputs are, i.e. backgrounds, text and dots, which have no
+depth), and the README only records the latency of some of it's stages, so it can't be modeled without guessing.
+
+The total latency of each path must fit within it's budget, which for game logic is the 24-tick clock (F1). Each path is
+checked for every backend (see `write_position_lut()`), where an artifact `<prefix>/<base>` is replaced by
+`<prefix>/<backend>/<base>` if it exists.
+
+Usage: `python timing.py [--backend BACKEND]`
+"""
+
+import os
+import argparse
+
+from typing import NamedTuple
+
+from main import decode_blueprint_string
+from simulator import Circuit
+
+
+class Fixed(NamedTuple):
+    name: str
+    ticks: int
+
+
+class Path(NamedTuple):
+    budget: int
+    stages: tuple
+
+
+class Timing(NamedTuple):
+    name: str
+    backend: str
+    budget: int
+    stages: list[tuple[str, int]]  # (name, ticks) of each stage
+
+    def ticks(self) -> int:
+        return sum(ticks for _, ticks in self.stages)
+
+    def ok(self) -> bool:
+        return self.ticks() <= self.budget
+
+    def __str__(self):
+        return 'TIMING %s [%s]: %d / %d ticks (%s)' % (
+            self.name, self.backend, self.ticks(), self.budget, ' -> '.join('%s=%d' % stage for stage in self.stages)
+        )
+
+
+def check_timing() -> list[Timing]:
+    """ Analyzes every path for every backend, printing each, and raises if any are over budget """
+    depths = {}
+    timings = [analyze(name, path, backend, depths) for backend in BACKENDS for name, path in PATHS.items()]
+    for timing in timings:
+        print(timing)
+    failed = ['%s [%s]' % (timing.name, timing.backend) for timing in timings if not timing.ok()]
+    if failed:
+        raise ValueError('Paths over budget: %s' % ', '.join(failed))
+    return timings
+
+
+def analyze(name: str, path: Path, backend: str, depths: dict[str, int]) -> Timing:
+    """ The latency of each stage of `path`, using `backend` where available. `depths` caches the depth of each artifact """
+    stages = []
+    for stage in path.stages:
+        if isinstance(stage, Fixed):
+            stages.append(stage)
+        else:
+            artifacts = (stage,) if isinstance(stage, str) else stage
+            artifacts = [resolve(artifact, backend) for artifact in artifacts]
+            for artifact in artifacts:
+                if artifact not in depths:
+                    depths[artifact] = artifact_depth(artifact)
+            stages.append(('|'.join(artifacts), max(depths[artifact] for artifact in artifacts)))
+    return Timing(name, backend, path.budget, stages)
+
+
+def resolve(artifact: str, backend: str) -> str:
+    """ The artifact `<prefix>/<backend>/<base>` if it exists, otherwise `artifact` """
+    if backend != 'decider':
+        prefix, base = os.path.split(artifact)
+        alternative = '%s/%s/%s' % (prefix, backend, base)
+        if os.path.exists('data/%s.txt' % alternative):
+            return alternative
+    return artifact
+
+
+def artifact_depth(artifact: str) -> int:
+    with open('data/%s.txt' % artifact, 'r', encoding='utf-8') as f:
+        return depth(decode_blueprint_string(f.read()))
+
+
+def depth(blueprint: dict) -> int:
+    """ The combinator depth of a blueprint, in ticks, from any external input to any external output """
+    circuit = Circuit(blueprint)
+    depths: dict[int, int] = {}
+    visiting: set[int] = set()
+
+    def visit(n: int) -> int:
+        if n in depths:
+            return depths[n]
+        if n not in circuit.reads:  # Constant combinators
+            return 0
+        if n in visiting:
+            raise ValueError('Combinator %d is part of a loop, which has no static depth' % n)
+        visiting.add(n)
+        depths[n] = 1 + max([visit(w) for net in circuit.reads[n] for w in circuit.writers.get(net, ())], default=0)
+        visiting.remove(n)
+        return depths[n]
+
+    return max((visit(n) for n in circuit.external_outputs), default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the latency of each logic path against the game clock')
+    parser.add_argument('--backend', choices=BACKENDS, default=None, help='Only analyze paths using this backend')
+    args = parser.parse_args()
+
+    if args.backend is None:
+        check_timing()
+    else:
+        depths = {}
+        for name, path in PATHS.items():
+            print(analyze(name, path, args.backend, depths))
+
+
+BACKENDS = ('decider', 'banked', 'packed')
+
+# Latencies of logic in the game which isn't generated
+BUS_BUFFER = Fixed('bus buffer', 1)  # Every bus is read through a 1-tick buffer
+REGISTER = Fixed('register', 1)  # Results are written back to a register
+OCTANT_FLAGS = Fixed('octant flags', 2)  # H, V, S1, S2 from (Xt - X, Yt - Y), as an arithmetic then a decider
+
+# N.B. The octant flags are modeled in series after `ghost/tile_type`, rather than in parallel with it, as a worst case:
+# the target (Xt, Yt) comes from ghost logic which isn't generated, so it isn't known to be ready when X, Y are
+
+GAME_TICK = 24  # The F1 clock, see the README
+
+PATHS = {
+    'pacman/movement': Path(GAME_TICK, (
+        BUS_BUFFER,
+        'pacman/tile_type',
+        ('pacman/d1_can_move', 'pacman/d2_can_move', 'pacman/d3_can_move'),
+        ('pacman/d2_next', 'pacman/d3_next', 'pacman/d_move'),
+        'pacman/facing',
+        REGISTER,
+    )),
+    'ghost/chase': Path(GAME_TICK, (
+        BUS_BUFFER,
+        'ghost/tile_type',
+        OCTANT_FLAGS,
+        'ghost/turn',
+        REGISTER,
+    )),
+    'ghost/frightened': Path(GAME_TICK, (
+        BUS_BUFFER,
+        'ghost/tile_type',
+        'ghost/random',
+        REGISTER,
+    )),
+    **{
+        'ghost/eyes_%d' % ghost: Path(GAME_TICK, (
+            BUS_BUFFER,
+            'ghost/path_lookup_%d' % ghost,
+            REGISTER,
+        ))
+        for ghost in range(4)
+    },
+    'ghost/eyes_shared': Path(GAME_TICK, (
+        BUS_BUFFER,
+        'ghost/shared/path_lookup',
+        REGISTER,
+    )),
+}
+
+
+if __name__ == '__main__':
+    main()